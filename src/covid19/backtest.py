@@ -0,0 +1,98 @@
+"""
+Scoring of historical forecasts against the data that was observed later.
+
+The forecast for each version is compared on cumulative cases, which is what
+the data source reports: the observed cases up to the version, plus the
+infections predicted after it.
+"""
+
+from dataclasses import dataclass
+import datetime
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from . import ensemble
+from .populations import Population
+from .simulation import forecast, Simulation
+
+
+LEADS = (1, 7, 14, 28)
+
+
+@dataclass
+class Score:
+    """Forecast errors of a single version, one list element per lead time.
+
+    Errors are None where the lead reaches beyond the data. The peak error is
+    the number of days by which the predicted peak of cases is late.
+    """
+
+    version: datetime.date
+    errors: List[Optional[int]]
+    percentage_errors: List[Optional[float]]
+    peak_error: int
+
+
+def score(
+    population: Population,
+    versions: Iterable[datetime.date],
+    leads: Sequence[int] = LEADS,
+    with_immunity: bool = True,
+) -> Iterator[Score]:
+    """Score the forecast of each version, in date order.
+
+    The observed data is fed once, and each version forecasts from a fork of
+    the simulation, for at least the longest lead. Only the forecast days are
+    scored, so the time taken grows linearly with the history. Results are
+    not cached, since every version is used only once.
+    """
+    actual = population.cases
+    _, _, cases = ensemble.replay(ensemble.Run(population))
+    peak = int(np.argmax(cases)) + 1 if len(cases) else 0
+
+    # The first day with the most cases so far, for every prefix of the data.
+    lowest = np.iinfo(np.int64).min
+    highest = np.maximum.accumulate(np.concatenate([[lowest], cases]))[:-1]
+    peaks = np.maximum.accumulate(
+        np.where(cases > highest, np.arange(1, len(cases) + 1), 0)
+    )
+
+    infections_per_day = population.difference().tolist()
+    simulation = Simulation(population.population, with_immunity)
+    for version in sorted(versions):
+        observed = min(max((version - population.start).days + 1, 0), len(actual))
+        while simulation.state.days < observed:
+            simulation.feed(infections_per_day[simulation.state.days])
+
+        # The forecast steps through at least the days from `start` to `end`.
+        end = version + datetime.timedelta(days=max(leads, default=1) - 1)
+        states = list(forecast(simulation.fork(), version, end))
+        predicted = np.cumsum([state.infections for state in states])
+        errors: List[Optional[int]] = []
+        percentage_errors: List[Optional[float]] = []
+        for lead in leads:
+            day = observed + lead
+            if not observed or day > len(actual):
+                errors.append(None)
+                percentage_errors.append(None)
+                continue
+
+            error = int(actual[observed - 1] + predicted[lead - 1] - actual[day - 1])
+            errors.append(error)
+            percentage_errors.append(
+                100 * abs(error) / int(actual[day - 1]) if actual[day - 1] else None
+            )
+
+        predicted_peak = int(peaks[observed - 1]) if observed else 0
+        if states:
+            state = max(states, key=lambda state: state.cases)
+            if not observed or state.cases > cases[predicted_peak - 1]:
+                predicted_peak = state.days
+        yield Score(version, errors, percentage_errors, predicted_peak - peak)
+
+
+def mean(values: Iterable[Optional[float]]) -> Optional[float]:
+    """Return the mean of the values that are not None, or None if there are none."""
+    values = [value for value in values if value is not None]
+    return sum(values) / len(values) if values else None
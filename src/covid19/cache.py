@@ -0,0 +1,55 @@
+"""
+Helpers shared by the on-disk caches.
+
+Files are written atomically, so readers never see a partial entry. Caches
+derived from a source file store its key, and are invalid once it changes.
+"""
+
+import contextlib
+from dataclasses import dataclass
+import hashlib
+import os
+from pathlib import Path
+from typing import IO, Iterator
+
+
+@contextlib.contextmanager
+def atomic_write(path: Path, mode: str = "w") -> Iterator[IO]:
+    """Open a temporary file that replaces `path` once it was written."""
+    temporary = path.with_name(f".{path.name}.tmp")
+    try:
+        with open(temporary, mode=mode) as fp:
+            yield fp
+        os.replace(temporary, path)
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            temporary.unlink()
+
+
+@dataclass
+class Key:
+    size: int
+    mtime: int
+    digest: str
+
+
+def digest(path: Path) -> str:
+    hash = hashlib.blake2b(digest_size=16)
+    with open(path, mode="rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b""):
+            hash.update(chunk)
+    return hash.hexdigest()
+
+
+def make_key(source: Path) -> Key:
+    stat = source.stat()
+    return Key(size=stat.st_size, mtime=stat.st_mtime_ns, digest=digest(source))
+
+
+def is_valid(key: Key, source: Path) -> bool:
+    """Return True if `source` still matches the key it was recorded with."""
+    stat = source.stat()
+    if stat.st_size != key.size:
+        return False
+
+    return stat.st_mtime_ns == key.mtime or digest(source) == key.digest
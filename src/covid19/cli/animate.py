@@ -1,49 +1,92 @@
+from concurrent.futures import ProcessPoolExecutor
 import datetime
-from pathlib import Path
-import tempfile
+from typing import List, Tuple
 
 import click
 import imageio
 import matplotlib.pyplot as plt
+from more_itertools import pairwise
+import numpy as np
 
 from . import options
 from .main import main
-from .plot import plot_predictions
-from .. import data, simulation
+from .plot import draw_predictions, plot_lines
+from .. import data, results, simulation
 from ..populations import Population
+from ..simulation import State
 
 
 def simulate(population: Population, start: int, stop: int, end: datetime.date):
-    for days in range(start, stop):
-        date = population.start + datetime.timedelta(days=days)
-        states = list(simulation.simulate(population, version=date, end=end))
+    versions = [
+        population.start + datetime.timedelta(days=days) for days in range(start, stop)
+    ]
+    for date, states in results.simulate_versions(population, versions, end=end):
         if states[-1].probability != 0:
             yield date, states
 
 
-def create_image(population: Population, tempdir: str, date, states, yscale: str):
-    image = str(Path(tempdir) / "{date:%Y%m%d}.png")
-    kwargs = dict(
-        version=date, plots=["cases"], output=image, legend=False, yscale=yscale
+def create_image(population: Population, date, states, yscale: str) -> np.ndarray:
+    """Draw a frame and return a copy of its RGBA pixels from the canvas."""
+    line = plt.axvline(x=date, color="tab:gray")
+    text = draw_predictions(
+        population, states, version=date, plots=["cases"], legend=False, yscale=yscale
     )
+    canvas = plt.gcf().canvas
+    canvas.draw()
+    image = np.array(canvas.buffer_rgba())
+    text.remove()
+    line.remove()
+    plot_lines(population, states, ["cases"], color="moccasin")
 
-    line = plt.axvline(x=date, color="tab:gray")
-    plot_predictions(population, states, **kwargs)
+    return image
 
-    yield imageio.imread(image)
 
-    line.remove()
-    plot_predictions(population, states, color="moccasin", **kwargs)
+def render(
+    population: Population,
+    simulations: List[Tuple[datetime.date, List[State]]],
+    start: int,
+    xlim: Tuple[datetime.date, datetime.date],
+    yscale: str,
+) -> List[np.ndarray]:
+    """Render the frames from `start` onwards on a figure of their own.
 
+    The predictions of earlier frames are drawn first, so each frame shows
+    the same trail as when all frames are rendered on one figure.
+    """
+    figure = plt.figure()
+    plt.xlim(*xlim)
+    for _, states in simulations[:start]:
+        plot_lines(population, states, ["cases"])
+        plot_lines(population, states, ["cases"], color="moccasin")
 
-def create_images(population: Population, tempdir: str, yscale: str):
+    images = [
+        create_image(population, date, states, yscale)
+        for date, states in simulations[start:]
+    ]
+    plt.close(figure)
+    return images
+
+
+def create_images(population: Population, yscale: str, jobs: int = 1):
     start = simulation.PROBABILITY_WINDOW_SIZE + 3
     stop = len(population.cases)
     end = population.start + datetime.timedelta(days=182)
     simulations = list(simulate(population, start, stop, end))
-    plt.xlim(left=simulations[0][0], right=end)
-    for date, states in simulations:
-        yield from create_image(population, tempdir, date, states, yscale)
+    xlim = (simulations[0][0], end)
+
+    if jobs == 1:
+        yield from render(population, simulations, 0, xlim, yscale)
+        return
+
+    bounds = [len(simulations) * index // jobs for index in range(jobs + 1)]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(render, population, simulations[:last], first, xlim, yscale)
+            for first, last in pairwise(bounds)
+            if first < last
+        ]
+        for future in futures:
+            yield from future.result()
 
 
 @main.command()
@@ -53,10 +96,10 @@ def create_images(population: Population, tempdir: str, yscale: str):
     "--output", "-o", metavar="FILE", default="covid19.gif", show_default=True
 )
 @options.yscale
-def animate(population: str, data_source: str, output: str, yscale: str):
-    _population = data.load(population, source=data_source)
+@options.jobs
+def animate(population: str, data_source: str, output: str, yscale: str, jobs: int):
+    _population = data.load(population, source=data_source, jobs=jobs)
 
-    with tempfile.TemporaryDirectory() as tempdir:
-        images = list(create_images(_population, tempdir, yscale))
-        images += images[-1:] * 5
-        imageio.mimwrite(output, images, format="GIF", fps=2)
+    images = list(create_images(_population, yscale, jobs))
+    images += images[-1:] * 5
+    imageio.mimwrite(output, images, format="GIF", fps=2)
@@ -0,0 +1,125 @@
+import csv
+import datetime
+import sys
+from typing import Iterator, List, Optional, Sequence
+
+import click
+import dateparser
+import humanize
+
+from . import options
+from .main import main
+from .. import backtest, data
+from ..backtest import Score
+
+
+def make_headers(leads: Sequence[int]) -> List[str]:
+    headers = ["version"]
+    for lead in leads:
+        headers += [f"error +{lead}d", f"error% +{lead}d"]
+    return headers + ["peak error"]
+
+
+def format_count(value: Optional[float]) -> str:
+    return humanize.intcomma(round(value)) if value is not None else "-"
+
+
+def format_percentage(value: Optional[float]) -> str:
+    return f"{value:.1f}%" if value is not None else "-"
+
+
+def format_score(score: Score) -> List[str]:
+    row = [f"{score.version:%b %d %Y}"]
+    for error, percentage_error in zip(score.errors, score.percentage_errors):
+        row += [format_count(error), format_percentage(percentage_error)]
+    return row + [f"{score.peak_error:+d}d"]
+
+
+def format_summary(scores: List[Score], leads: Sequence[int]) -> List[str]:
+    row = ["mean"]
+    for index in range(len(leads)):
+        errors = (score.errors[index] for score in scores)
+        row += [
+            format_count(
+                backtest.mean(
+                    abs(error) if error is not None else None for error in errors
+                )
+            ),
+            format_percentage(
+                backtest.mean(score.percentage_errors[index] for score in scores)
+            ),
+        ]
+    peak_error = backtest.mean(abs(score.peak_error) for score in scores)
+    return row + [f"{peak_error:.1f}d" if peak_error is not None else "-"]
+
+
+def print_backtest(
+    scores: Iterator[Score], leads: Sequence[int], as_csv: bool = False
+) -> None:
+    """Print a row per version as it is scored, then the mean absolute errors."""
+    headers = make_headers(leads)
+    if as_csv:
+        writer = csv.writer(sys.stdout)
+        write = writer.writerow
+    else:
+        widths = [max(len(header), 12) for header in headers]
+
+        def write(row: List[str]) -> None:
+            print("  ".join(value.rjust(width) for value, width in zip(row, widths)))
+
+    write(headers)
+    if not as_csv:
+        write(["-" * width for width in widths])
+
+    seen = []
+    for score in scores:
+        seen.append(score)
+        write(format_score(score))
+        sys.stdout.flush()
+
+    if not as_csv:
+        write(["-" * width for width in widths])
+    write(format_summary(seen, leads))
+
+
+@main.command("backtest")
+@options.population
+@options.data_source
+@options.with_immunity
+@click.option(
+    "--lead",
+    "leads",
+    metavar="DAYS",
+    type=click.IntRange(min=1),
+    multiple=True,
+    default=list(backtest.LEADS),
+    show_default=True,
+    help="Score the forecasts DAYS days after each version",
+)
+@click.option("--since", metavar="DATE", help="Score versions from DATE onwards")
+@click.option("--csv", "as_csv", is_flag=True, help="Print comma-separated values")
+@options.jobs
+def _backtest(
+    population: str,
+    data_source: str,
+    with_immunity: bool,
+    leads: Sequence[int],
+    since: Optional[str],
+    as_csv: bool,
+    jobs: int,
+):
+    """Score historical forecasts against the data observed later.
+
+    Errors are given for cumulative cases. The mean row gives the mean
+    absolute error, the mean absolute percentage error, and the mean
+    absolute error of the peak date.
+    """
+    _population = data.load(population, source=data_source, jobs=jobs)
+    first = dateparser.parse(since).date() if since is not None else _population.start
+    dates = (
+        _population.start + datetime.timedelta(days=days)
+        for days in range(len(_population.cases))
+    )
+    versions = [date for date in dates if date >= first]
+    scores = backtest.score(_population, versions, leads, with_immunity)
+    print_backtest(scores, leads, as_csv)
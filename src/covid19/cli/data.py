@@ -14,7 +14,7 @@ from ..populations import Population
 
 def format_row(population: Population, days: int, cases: int) -> Dict[str, str]:
     date = population.start + datetime.timedelta(days)
-    previous = population.cases[days - 1] if days > 0 else 0
+    previous = int(population.cases[days - 1]) if days > 0 else 0
     return {
         "date": f"{date:%a %b %d %Y}",
         "cases": cases,
@@ -27,7 +27,7 @@ def format_row(population: Population, days: int, cases: int) -> Dict[str, str]:
 def print_population(population: Population) -> None:
     table = [
         format_row(population, days, cases)
-        for days, cases in enumerate(population.cases)
+        for days, cases in enumerate(population.cases.tolist())
     ]
     text = f"""\
 {heading(population.name)}
@@ -42,6 +42,7 @@ population = {humanize.intword(population.population)}
 @main.command()
 @options.population
 @options.data_source
-def data(population: str, data_source: str) -> None:
-    _population = _data.load(population, source=data_source)
+@options.jobs
+def data(population: str, data_source: str, jobs: int) -> None:
+    _population = _data.load(population, source=data_source, jobs=jobs)
     print_population(_population)
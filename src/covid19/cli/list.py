@@ -10,7 +10,7 @@ from tabulate import tabulate
 from . import options
 from .main import main
 from .utils import heading
-from .. import data, simulation
+from .. import data, results, simulation
 from ..populations import Population
 
 
@@ -56,7 +56,7 @@ def format_state(
 
 
 def print_predictions(population: Population, with_immunity: bool) -> None:
-    states = list(simulation.simulate(population, with_immunity))
+    states = results.simulate(population, with_immunity)
     rows = [
         format_state(state, population, accumulated_infections)
         for state, accumulated_infections in zip(
@@ -1,6 +1,16 @@
 import click
 
+from ..data import api
+
 
 @click.group()
-def main():
+@click.option(
+    "--offline",
+    is_flag=True,
+    envvar="COVID19_OFFLINE",
+    help="Use cached API responses without contacting the service",
+)
+def main(offline: bool):
     """COVID-19 analysis"""
+    if offline:
+        api.offline = True
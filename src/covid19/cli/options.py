@@ -5,3 +5,6 @@ population = click.option("--population", "-p", default="Germany", show_default=
 data_source = click.option("--data-source", "-s", default="rki", show_default=True)
 with_immunity = click.option("--immunity/--no-immunity", "with_immunity", default=True)
 yscale = click.option("--yscale", metavar="SCALE", default="linear", show_default=True)
+jobs = click.option(
+    "--jobs", "-j", metavar="N", default=1, show_default=True, help="Worker processes"
+)
@@ -5,10 +5,11 @@ import click
 import dateparser
 import matplotlib.pyplot as plt
 import matplotlib.dates
+import matplotlib.text
 
 from . import options
 from .main import main
-from .. import data, simulation
+from .. import data, ensemble, results, simulation
 from ..populations import Population
 
 
@@ -19,22 +20,15 @@ def set_aspect_ratio(ratio):
     axes.set_aspect(abs((right - left) / (bottom - top)) * ratio)
 
 
-def plot_predictions(
+def plot_lines(
     population: Population,
     states: List[simulation.State],
-    version: Optional[datetime.date],
     plots: List[str],
-    output: Optional[str],
     color: str = "tab:orange",
-    legend: bool = True,
-    yscale: str = "linear",
 ) -> None:
     def percentage(value):
         return 100 * value / population.population
 
-    if version is None:
-        version = population.start + datetime.timedelta(days=len(population.cases))
-
     dates = [
         population.start + datetime.timedelta(days=state.days - 1) for state in states
     ]
@@ -43,8 +37,6 @@ def plot_predictions(
     infections = [percentage(state.infections) for state in states]
     recoveries = [percentage(state.recoveries) for state in states]
 
-    plt.yscale(yscale)
-
     if "cases" in plots:
         plt.plot(
             dates, cases, label="cases", color=color,
@@ -65,6 +57,56 @@ def plot_predictions(
             dates, recoveries, label="recoveries", color="tab:green",
         )
 
+
+def plot_bands(
+    population: Population,
+    bands: ensemble.Bands,
+    plots: List[str],
+    color: str = "tab:orange",
+) -> None:
+    dates = [
+        population.start + datetime.timedelta(days=days - 1)
+        for days in bands.days.tolist()
+    ]
+    colors = {
+        "cases": color,
+        "immune": "tab:blue",
+        "infections": "tab:red",
+        "recoveries": "tab:green",
+    }
+    count = len(bands.quantiles)
+    for plot in plots:
+        values = 100 * getattr(bands, plot) / population.population
+        for index in range(count // 2):
+            plt.fill_between(
+                dates,
+                values[:, index],
+                values[:, count - 1 - index],
+                color=colors[plot],
+                alpha=0.2,
+                linewidth=0,
+            )
+
+
+def draw_predictions(
+    population: Population,
+    states: List[simulation.State],
+    version: Optional[datetime.date],
+    plots: List[str],
+    color: str = "tab:orange",
+    legend: bool = True,
+    yscale: str = "linear",
+    bands: Optional[ensemble.Bands] = None,
+) -> matplotlib.text.Text:
+    """Draw the predictions on the current figure, and return the footer text."""
+    if version is None:
+        version = population.start + datetime.timedelta(days=len(population.cases))
+
+    plt.yscale(yscale)
+    plot_lines(population, states, plots, color)
+    if bands is not None:
+        plot_bands(population, bands, plots, color)
+
     title = f"""\
 COVID-19 simulation for {population.name}
 
@@ -96,6 +138,24 @@ daily predictions based on data from RKI
     xaxis.set_major_locator(locator)
     xaxis.set_major_formatter(formatter)
 
+    return text
+
+
+def plot_predictions(
+    population: Population,
+    states: List[simulation.State],
+    version: Optional[datetime.date],
+    plots: List[str],
+    output: Optional[str],
+    color: str = "tab:orange",
+    legend: bool = True,
+    yscale: str = "linear",
+    bands: Optional[ensemble.Bands] = None,
+) -> None:
+    text = draw_predictions(
+        population, states, version, plots, color, legend, yscale, bands
+    )
+
     if output is None:
         plt.show()
     else:
@@ -114,6 +174,14 @@ daily predictions based on data from RKI
 @click.option("--date", metavar="DATE", help="Base simulation on data as of DATE")
 @options.with_immunity
 @click.option("--output", "-o", metavar="FILE")
+@click.option(
+    "--samples",
+    metavar="N",
+    type=int,
+    default=0,
+    help="Draw quantile bands from N stochastic forecasts",
+)
+@click.option("--seed", type=int, help="Seed for the stochastic forecasts")
 def plot(
     population: str,
     plot_cases: bool,
@@ -124,10 +192,12 @@ def plot(
     date: Optional[str],
     with_immunity: bool,
     output: Optional[str],
+    samples: int,
+    seed: Optional[int],
 ):
     _population = data.load(population)
     version = dateparser.parse(date).date() if date is not None else None
-    states = simulation.simulate(_population, with_immunity, version)
+    states = results.simulate(_population, with_immunity, version)
     plots = sum(
         [
             ["cases"] if plot_cases else [],
@@ -137,11 +207,17 @@ def plot(
         ],
         start=[],
     )
+    bands = None
+    if samples > 0:
+        run = ensemble.Run(_population, with_immunity, version)
+        steps = states[-1].days - len(_population.as_of(version).cases)
+        bands = ensemble.sample(run, samples, steps, seed=seed)
     plot_predictions(
         population=_population,
-        states=list(states),
+        states=states,
         version=version,
         plots=plots,
         output=output,
         yscale=yscale,
+        bands=bands,
     )
@@ -2,7 +2,7 @@ import datetime
 from typing import Dict
 
 import click
-from more_itertools import difference, pairwise
+from more_itertools import pairwise
 from tabulate import tabulate
 
 from . import options
@@ -29,10 +29,10 @@ def print_rates(population: Population, recovery: bool) -> None:
         simulation = Simulation(population.population)
         cases = [
             simulation.feed(infections).cases
-            for infections in difference(population.cases)
+            for infections in population.difference().tolist()
         ]
     else:
-        cases = population.cases
+        cases = population.cases.tolist()
 
     rates = [value / previous for previous, value in pairwise(cases)]
     table = [format_cell(population, days, rate) for days, rate in enumerate(rates)]
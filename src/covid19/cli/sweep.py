@@ -0,0 +1,162 @@
+import csv
+import datetime
+from itertools import product
+import sys
+from typing import Dict, List, Sequence
+
+import click
+import humanize
+from tabulate import tabulate
+
+from . import options
+from .main import main
+from .. import data, ensemble, simulation
+from ..populations import Population
+
+
+headers = "keys"
+
+
+def parse_ranges(ctx, param, values: Sequence[str]) -> List[int]:
+    """Expand values of the form N, START:STOP or START:STOP:STEP (inclusive)."""
+    result = []
+    for value in values:
+        try:
+            bounds = [int(bound) for bound in value.split(":")]
+        except ValueError:
+            raise click.BadParameter(f"invalid range {value}") from None
+
+        if not 1 <= len(bounds) <= 3:
+            raise click.BadParameter(f"invalid range {value}")
+
+        start = bounds[0]
+        stop = bounds[1] if len(bounds) > 1 else start
+        step = bounds[2] if len(bounds) > 2 else 1
+        if start < 1 or step < 1:
+            raise click.BadParameter(f"range must be positive: {value}")
+
+        result.extend(range(start, stop + 1, step))
+
+    return result
+
+
+def format_row(
+    run: ensemble.Run, peak_cases: int, peak_days: int, immune: int
+) -> Dict[str, str]:
+    population = run.population
+    date = population.start + datetime.timedelta(days=peak_days - 1)
+    return {
+        "population": population.name,
+        "immunity": "yes" if run.with_immunity else "no",
+        "duration": run.average_case_duration,
+        "window": run.probability_window_size,
+        "eta": f"{run.eta:g}",
+        "peak cases": humanize.intcomma(peak_cases),
+        "peak date": f"{date:%b %d %Y}",
+        "immune%": f"{100 * immune / population.population:.1f}%",
+    }
+
+
+def print_sweep(
+    populations: List[Population],
+    immunities: Sequence[bool],
+    durations: Sequence[int],
+    windows: Sequence[int],
+    etas: Sequence[float],
+    as_csv: bool = False,
+) -> None:
+    runs = [
+        ensemble.Run(
+            population,
+            with_immunity,
+            average_case_duration=duration,
+            probability_window_size=window,
+            eta=eta,
+        )
+        for population, with_immunity, duration, window, eta in product(
+            populations, immunities, durations, windows, etas
+        )
+    ]
+    summary = ensemble.summarize(runs)
+    table = [
+        format_row(run, *values)
+        for run, values in zip(
+            runs,
+            zip(
+                summary.peak_cases.tolist(),
+                summary.peak_days.tolist(),
+                summary.immune.tolist(),
+            ),
+        )
+    ]
+    if as_csv:
+        writer = csv.DictWriter(sys.stdout, fieldnames=table[0] if table else [])
+        writer.writeheader()
+        writer.writerows(table)
+    else:
+        print(tabulate(table, headers, stralign="right", disable_numparse=True))
+
+
+@main.command()
+@click.option(
+    "--population",
+    "-p",
+    "populations",
+    multiple=True,
+    default=["Germany"],
+    show_default=True,
+)
+@options.data_source
+@click.option(
+    "--immunity",
+    "immunities",
+    type=click.BOOL,
+    multiple=True,
+    default=[True],
+    show_default=True,
+    metavar="BOOL",
+)
+@click.option(
+    "--duration",
+    "durations",
+    metavar="RANGE",
+    multiple=True,
+    default=[str(simulation.AVERAGE_CASE_DURATION)],
+    show_default=True,
+    callback=parse_ranges,
+    help="Average case duration in days",
+)
+@click.option(
+    "--window",
+    "windows",
+    metavar="RANGE",
+    multiple=True,
+    default=[str(simulation.PROBABILITY_WINDOW_SIZE)],
+    show_default=True,
+    callback=parse_ranges,
+    help="Probability window size in days",
+)
+@click.option(
+    "--eta",
+    "etas",
+    type=float,
+    multiple=True,
+    default=[simulation.ETA],
+    show_default=True,
+    help="Convergence threshold",
+)
+@click.option("--csv", "as_csv", is_flag=True, help="Print comma-separated values")
+@options.jobs
+def sweep(
+    populations: Sequence[str],
+    data_source: str,
+    immunities: Sequence[bool],
+    durations: List[int],
+    windows: List[int],
+    etas: Sequence[float],
+    as_csv: bool,
+    jobs: int,
+):
+    """Simulate a grid of parameters and print peaks and final immunity."""
+    _populations = data.load_many(populations, source=data_source, jobs=jobs)
+    print_sweep(_populations, immunities, durations, windows, etas, as_csv)
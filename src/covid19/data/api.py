@@ -1,16 +1,29 @@
 from collections import defaultdict
+from concurrent.futures import as_completed, ThreadPoolExecutor
 from dataclasses import dataclass
 import datetime
-from typing import Any, Iterator, List, Sequence
+import json
+from pathlib import Path
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
+import appdirs
 import dateutil.parser
 import dateutil.tz
 import requests
 
+from . import download
+from .. import cache
 from ..populations import Population
 
 
 url = "https://covid19-germany.appspot.com/timeseries/{state}/cases"
+max_workers = 16
+cachedir = (
+    Path(appdirs.user_cache_dir(appname="covid19", appauthor="cjolowicz")) / "api"
+)
+ttl = datetime.timedelta(hours=1)
+offline = False
 
 iso_3166_2_de_reverse = {
     "DE-BW": "Baden-Württemberg",
@@ -62,15 +75,25 @@ class Record:
     cases: int
 
 
-def request_data(name: str) -> Any:
+def request_data(
+    name: str,
+    session: Optional[requests.Session] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> Tuple[Optional[Any], Dict[str, str]]:
+    """Return the payload, or None if not modified, and the response validators."""
+    if session is None:
+        with download.create_session() as session:
+            return request_data(name, session, headers)
+
     code = iso_3166_2_de[name]
-    with requests.get(url.format(state=code)) as response:
+    with session.get(url.format(state=code), headers=headers) as response:
+        if response.status_code == 304:
+            return None, download.validators(response)
         response.raise_for_status()
-        return response.json()
+        return response.json(), download.validators(response)
 
 
-def load_records(name: str) -> Iterator[Record]:
-    data = request_data(name)
+def parse_records(data: Any) -> Iterator[Record]:
     for entry in data["data"]:
         for date, cases in entry.items():
             yield Record(
@@ -78,7 +101,76 @@ def load_records(name: str) -> Iterator[Record]:
             )
 
 
-def aggregate(records: Sequence[Record]) -> List[Record]:
+def cachefile(name: str) -> Path:
+    return cachedir / f"{iso_3166_2_de[name]}.json"
+
+
+def read_cache(name: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(cachefile(name)) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def write_cache(name: str, entry: Dict[str, Any]) -> None:
+    cachedir.mkdir(parents=True, exist_ok=True)
+    with cache.atomic_write(cachefile(name)) as fp:
+        json.dump(entry, fp)
+
+
+def load_records(
+    name: str, session: Optional[requests.Session] = None
+) -> Iterator[Record]:
+    """Return the records of a state, from the cache while it is fresh.
+
+    Stale entries are revalidated with the stored ETag or Last-Modified, and
+    returned as they are if the service cannot be reached. In offline mode,
+    cached records are returned regardless of their age.
+    """
+    entry = read_cache(name)
+    if entry is not None and (
+        offline or time.time() - entry["checked"] < ttl.total_seconds()
+    ):
+        return decode_records(entry)
+
+    if offline:
+        raise ValueError(f"no cached data for {name}")
+
+    headers = {}
+    if entry is not None:
+        if "etag" in entry["validators"]:
+            headers["If-None-Match"] = entry["validators"]["etag"]
+        if "last_modified" in entry["validators"]:
+            headers["If-Modified-Since"] = entry["validators"]["last_modified"]
+
+    try:
+        data, validators = request_data(name, session, headers)
+    except requests.RequestException:
+        if entry is None:
+            raise
+        return decode_records(entry)
+
+    if data is not None:
+        records = list(parse_records(data))
+        entry = {
+            "validators": validators,
+            "records": [
+                [record.datetime.isoformat(), record.cases] for record in records
+            ],
+        }
+    entry["checked"] = time.time()
+    write_cache(name, entry)
+
+    return decode_records(entry)
+
+
+def decode_records(entry: Dict[str, Any]) -> Iterator[Record]:
+    for timestamp, cases in entry["records"]:
+        yield Record(datetime=datetime.datetime.fromisoformat(timestamp), cases=cases)
+
+
+def aggregate(records: Iterable[Record]) -> List[Record]:
     timeseries = defaultdict(int)
     for record in records:
         utctime = record.datetime.astimezone(tz=dateutil.tz.UTC)
@@ -105,13 +197,32 @@ def load_state(name: str) -> Population:
     return load_population(name, records)
 
 
+def fetch_all() -> Iterator[Tuple[str, List[Record]]]:
+    """Fetch all states concurrently, yielding each as soon as it arrives."""
+    session = download.create_session(max_workers)
+    with session, ThreadPoolExecutor(max_workers) as executor:
+        futures = {
+            executor.submit(lambda name: list(load_records(name, session)), name): name
+            for name in iso_3166_2_de
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
 def load_germany() -> Population:
-    records = aggregate(
-        record for name in iso_3166_2_de for record in load_records(name)
-    )
+    records = aggregate(record for _, records in fetch_all() for record in records)
     return load_population("Germany", records)
 
 
+def load_all() -> List[Population]:
+    states = dict(fetch_all())
+    populations = [
+        load_population(name, aggregate(states[name])) for name in iso_3166_2_de
+    ]
+    germany = aggregate(record for records in states.values() for record in records)
+    return populations + [load_population("Germany", germany)]
+
+
 def load(name: str) -> Population:
     if name.lower() == "germany":
         return load_germany()
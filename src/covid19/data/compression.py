@@ -0,0 +1,166 @@
+"""
+Block-compressed storage for cached CSV files.
+
+Files are written as a sequence of independent gzip members, each holding
+whole lines, so any gzip reader can stream them. A block table next to the
+file maps uncompressed offsets to the members they start in, which lets
+open_binary() seek without decompressing from the beginning.
+"""
+
+from bisect import bisect_right
+from dataclasses import asdict
+import gzip
+import io
+import json
+from pathlib import Path
+from typing import BinaryIO, List, Optional, TextIO, Tuple
+import zlib
+
+from .. import cache
+
+
+BLOCK_SIZE = 1 << 20
+LEVEL = 1
+CHUNK_SIZE = 1 << 16
+
+Blocks = List[Tuple[int, int]]
+
+
+def blocksfile(path: Path) -> Path:
+    return path.with_name(f"{path.name}.blocks")
+
+
+def compress(source: Path, target: Path) -> None:
+    """Compress `source` into `target`, one gzip member per block of lines."""
+    blocks: Blocks = []
+    compressed = uncompressed = 0
+    with open(source, mode="rb") as input, cache.atomic_write(
+        target, mode="wb"
+    ) as output:
+        pending = b""
+        while True:
+            chunk = input.read(BLOCK_SIZE)
+            data = pending + chunk
+            end = len(data) if not chunk else data.rfind(b"\n") + 1
+            if end == 0 and chunk:
+                pending = data
+                continue
+            block, pending = data[:end], data[end:]
+            if block:
+                member = gzip.compress(block, compresslevel=LEVEL, mtime=0)
+                output.write(member)
+                blocks.append((compressed, uncompressed))
+                compressed += len(member)
+                uncompressed += len(block)
+            if not chunk:
+                break
+
+    table = {
+        "key": asdict(cache.make_key(target)),
+        "size": uncompressed,
+        "blocks": blocks,
+    }
+    with cache.atomic_write(blocksfile(target)) as fp:
+        json.dump(table, fp)
+
+
+def read_blocks(path: Path) -> Optional[Tuple[Blocks, int]]:
+    try:
+        with open(blocksfile(path)) as fp:
+            table = json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+    if not cache.is_valid(cache.Key(**table["key"]), path):
+        return None
+
+    return [tuple(block) for block in table["blocks"]], table["size"]
+
+
+class BlockReader(io.RawIOBase):
+    """Seekable reader over the uncompressed contents of a block-compressed file.
+
+    Without a valid block table, seeking decompresses from the start.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.raw = open(path, mode="rb")
+        table = read_blocks(path)
+        self.blocks, self.size = table if table is not None else ([(0, 0)], None)
+        self.offsets = [offset for _, offset in self.blocks]
+        self.seek(0)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def close(self) -> None:
+        self.raw.close()
+        super().close()
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            if self.size is None:
+                while self.read(CHUNK_SIZE):
+                    pass
+                self.size = self.position
+            offset += self.size
+
+        compressed, self.position = self.blocks[bisect_right(self.offsets, offset) - 1]
+        self.raw.seek(compressed)
+        self.decompressor = zlib.decompressobj(wbits=31)
+        self.buffer, self.index = b"", 0
+
+        while self.position < offset and self.read(
+            min(offset - self.position, CHUNK_SIZE)
+        ):
+            pass
+
+        return self.position
+
+    def fill(self) -> None:
+        while self.index == len(self.buffer):
+            if self.decompressor.eof:
+                data = self.decompressor.unused_data
+                self.decompressor = zlib.decompressobj(wbits=31)
+            else:
+                data = b""
+            data = data or self.raw.read(CHUNK_SIZE)
+            if not data:
+                return
+            self.buffer, self.index = self.decompressor.decompress(data), 0
+
+    def readinto(self, buffer) -> int:
+        self.fill()
+        size = min(len(buffer), len(self.buffer) - self.index)
+        buffer[:size] = self.buffer[self.index : self.index + size]
+        self.index += size
+        self.position += size
+        return size
+
+
+def is_compressed(path: Path) -> bool:
+    return path.suffix == ".gz"
+
+
+def open_binary(path: Path) -> BinaryIO:
+    """Open a cached file for seekable reading of its uncompressed bytes."""
+    if not is_compressed(path):
+        return open(path, mode="rb")
+
+    return io.BufferedReader(BlockReader(path), buffer_size=CHUNK_SIZE)
+
+
+def open_text(path: Path) -> TextIO:
+    """Open a cached CSV file as a text stream, decompressing on the fly."""
+    if not is_compressed(path):
+        return open(path, newline="", encoding="utf-8-sig")
+
+    return gzip.open(path, mode="rt", newline="", encoding="utf-8-sig")
@@ -0,0 +1,213 @@
+"""
+Case cube over district, age group, gender and date.
+
+States are a level above districts: each district belongs to one state, so
+state queries roll up the districts of that state.
+"""
+
+from array import array
+from dataclasses import dataclass
+import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ..populations import Population
+
+
+MEASURES = ("cases", "deceased")
+
+
+class Labels:
+    """Assign consecutive codes to the values of a dimension."""
+
+    def __init__(self) -> None:
+        self.codes: Dict[str, int] = {}
+
+    def __call__(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.codes)
+        return code
+
+    def values(self) -> list:
+        return list(self.codes)
+
+
+@dataclass
+class Cube:
+    states: List[str]
+    districts: List[Tuple[int, str]]
+    district_states: np.ndarray
+    age_groups: List[str]
+    genders: List[str]
+    start: datetime.date
+    cases: np.ndarray
+    deceased: np.ndarray
+
+    @property
+    def dates(self) -> List[datetime.date]:
+        return [
+            self.start + datetime.timedelta(days=days)
+            for days in range(self.cases.shape[-1])
+        ]
+
+    def _district_codes(
+        self, state: Optional[str], district: Optional[object]
+    ) -> np.ndarray:
+        codes = np.arange(len(self.districts))
+        if state is not None and state.lower() != "germany":
+            codes = codes[self.district_states == _lookup(self.states, state)]
+        if district is not None:
+            codes = np.array(
+                [
+                    code
+                    for code in codes
+                    if district == self.districts[code][0]
+                    or str(district).lower() == self.districts[code][1].lower()
+                ],
+                dtype=np.intp,
+            )
+        return codes
+
+    def slice(
+        self,
+        measure: str = "cases",
+        *,
+        state: Optional[str] = None,
+        district: Optional[object] = None,
+        age_group: Optional[str] = None,
+        gender: Optional[str] = None,
+    ) -> np.ndarray:
+        """Return daily counts, summed over every dimension not fixed here.
+
+        `district` is either the district ID or its name.
+        """
+        data = getattr(self, measure)
+        districts = self._district_codes(state, district)
+        age_groups = (
+            np.arange(len(self.age_groups))
+            if age_group is None
+            else [_lookup(self.age_groups, age_group)]
+        )
+        genders = (
+            np.arange(len(self.genders))
+            if gender is None
+            else [_lookup(self.genders, gender)]
+        )
+        return data[np.ix_(districts, age_groups, genders)].sum(axis=(0, 1, 2))
+
+    def rollup(self, by: str, measure: str = "cases") -> Dict[str, np.ndarray]:
+        """Return daily counts for each value of the dimension `by`."""
+        data = getattr(self, measure)
+        if by == "state":
+            totals = np.zeros((len(self.states), data.shape[-1]), dtype=data.dtype)
+            np.add.at(totals, self.district_states, data.sum(axis=(1, 2)))
+            return dict(zip(self.states, totals))
+        if by == "district":
+            names = [name for _, name in self.districts]
+            return dict(zip(names, data.sum(axis=(1, 2))))
+        if by == "age_group":
+            return dict(zip(self.age_groups, data.sum(axis=(0, 2))))
+        if by == "gender":
+            return dict(zip(self.genders, data.sum(axis=(0, 1))))
+        raise ValueError(f"invalid dimension {by}")
+
+    def population(
+        self,
+        name: str,
+        population: int,
+        measure: str = "cases",
+        **selection: Optional[str],
+    ) -> Population:
+        """Return a cumulative series for a slice, from its first to last count.
+
+        Like the per-state series of rki_arcgis, a slice ends on its own last
+        reported day, not on the last day of the cube.
+        """
+        daily = self.slice(measure, **selection)
+        nonzero = np.flatnonzero(daily)
+        first, last = (nonzero[0], nonzero[-1]) if len(nonzero) else (0, len(daily) - 1)
+        return Population(
+            name=name,
+            population=population,
+            start=self.start + datetime.timedelta(days=int(first)),
+            cases=np.cumsum(daily[first : last + 1]),
+        )
+
+
+def _scatter(cells: np.ndarray, values: np.ndarray, shape: tuple) -> np.ndarray:
+    """Sum values into a dense array; the float sums are exact for counts."""
+    size = int(np.prod(shape))
+    totals = np.bincount(cells, weights=values, minlength=size)
+    return totals.round().astype(np.int64).reshape(shape)
+
+
+def _lookup(values: List[str], value: str) -> int:
+    for code, candidate in enumerate(values):
+        if value.lower() == candidate.lower():
+            return code
+    raise ValueError(f"unknown value {value}")
+
+
+Row = Tuple[str, int, str, str, str, datetime.date, int, int]
+
+
+def build(rows: Iterable[Row]) -> Cube:
+    """Build the cube in a single pass.
+
+    Each row is (state, district_id, district, age_group, gender, date, cases,
+    deceased).
+    """
+    states, districts, age_groups, genders = Labels(), Labels(), Labels(), Labels()
+    district_states: Dict[int, int] = {}
+    district_codes, age_codes, gender_codes = array("i"), array("i"), array("i")
+    ordinals, cases, deceased = array("q"), array("q"), array("q")
+
+    for state, district_id, district, age_group, gender, date, *measures in rows:
+        code = districts((district_id, district))
+        district_states.setdefault(code, states(state))
+        district_codes.append(code)
+        age_codes.append(age_groups(age_group))
+        gender_codes.append(genders(gender))
+        ordinals.append(date.toordinal())
+        cases.append(measures[0])
+        deceased.append(measures[1])
+
+    if not ordinals:
+        raise ValueError("no records")
+
+    days = np.frombuffer(ordinals, dtype=np.int64)
+    first = int(days.min())
+    shape = (
+        len(districts.codes),
+        len(age_groups.codes),
+        len(genders.codes),
+        int(days.max()) - first + 1,
+    )
+    cells = np.ravel_multi_index(
+        (
+            np.frombuffer(district_codes, dtype=np.intc),
+            np.frombuffer(age_codes, dtype=np.intc),
+            np.frombuffer(gender_codes, dtype=np.intc),
+            days - first,
+        ),
+        shape,
+    )
+    data = {
+        measure: _scatter(cells, np.frombuffer(values, dtype=np.int64), shape)
+        for measure, values in zip(MEASURES, (cases, deceased))
+    }
+
+    return Cube(
+        states=states.values(),
+        districts=districts.values(),
+        district_states=np.array(
+            [district_states[code] for code in range(shape[0])], dtype=np.intp
+        ),
+        age_groups=age_groups.values(),
+        genders=genders.values(),
+        start=datetime.date.fromordinal(first),
+        cases=data["cases"],
+        deceased=data["deceased"],
+    )
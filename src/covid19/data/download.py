@@ -0,0 +1,152 @@
+"""
+Conditional, resumable downloads into the cache directory.
+
+Validators (ETag, Last-Modified) are kept in a JSON file next to the download,
+so an unchanged resource costs a single 304 response. Data is streamed into a
+partial file which is renamed into place once complete; an interrupted
+transfer is resumed with a Range request on the next attempt.
+"""
+
+import json
+import os
+from pathlib import Path
+import time
+from typing import Any, Dict, Optional
+
+import requests
+
+from . import compression
+from .. import cache
+
+
+CHUNK_SIZE = 1 << 16
+RETRIES = 5
+BACKOFF_FACTOR = 0.5
+
+
+def create_session(pool_size: int = 10) -> requests.Session:
+    """Create a session with a connection pool that retries with backoff."""
+    retry = requests.adapters.Retry(
+        total=RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+    )
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def metadatafile(path: Path) -> Path:
+    return path.with_name(f"{path.name}.json")
+
+
+def partfile(path: Path) -> Path:
+    return path.with_name(f"{path.name}.part")
+
+
+def load_metadata(path: Path) -> Dict[str, Any]:
+    try:
+        with open(metadatafile(path)) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_metadata(path: Path, metadata: Dict[str, Any]) -> None:
+    with cache.atomic_write(metadatafile(path)) as fp:
+        json.dump(metadata, fp)
+
+
+def validators(response: requests.Response) -> Dict[str, str]:
+    result = {}
+    if "ETag" in response.headers:
+        result["etag"] = response.headers["ETag"]
+    if "Last-Modified" in response.headers:
+        result["last_modified"] = response.headers["Last-Modified"]
+    return result
+
+
+def last_checked(path: Path) -> Optional[float]:
+    """Return when `path` was last downloaded or revalidated, as a timestamp."""
+    if not path.exists():
+        return None
+
+    return load_metadata(path).get("checked", path.stat().st_mtime)
+
+
+def download(
+    url: str,
+    path: Path,
+    session: Optional[requests.Session] = None,
+    compress: bool = False,
+) -> bool:
+    """Download `url` to `path` unless the copy on disk is still current.
+
+    With `compress`, the completed download is stored block-compressed.
+    Returns True if `path` was (re)written, False if the server answered 304.
+    """
+    if session is None:
+        with requests.Session() as session:
+            return download(url, path, session, compress)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    metadata = load_metadata(path)
+    part = partfile(path)
+    headers = {}
+
+    if path.exists():
+        if "etag" in metadata:
+            headers["If-None-Match"] = metadata["etag"]
+        if "last_modified" in metadata:
+            headers["If-Modified-Since"] = metadata["last_modified"]
+
+    partial = metadata.get("partial", {})
+    offset = part.stat().st_size if part.exists() else 0
+    validator = partial.get("etag", partial.get("last_modified"))
+    if offset and validator is not None:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+
+    with session.get(url, headers=headers, stream=True) as response:
+        if response.status_code == 304:
+            part.unlink(missing_ok=True)
+            metadata.pop("partial", None)
+            metadata["checked"] = time.time()
+            save_metadata(path, metadata)
+            return False
+
+        resume = response.status_code == 206
+        if response.status_code == 416 or (
+            resume
+            and not response.headers.get("Content-Range", "").startswith(
+                f"bytes {offset}-"
+            )
+        ):
+            # The partial file cannot be resumed; start over.
+            part.unlink(missing_ok=True)
+            metadata.pop("partial", None)
+            save_metadata(path, metadata)
+            return download(url, path, session, compress)
+
+        response.raise_for_status()
+
+        if not resume:
+            metadata["partial"] = validators(response)
+            save_metadata(path, metadata)
+
+        with open(part, mode="ab" if resume else "wb") as fp:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                fp.write(chunk)
+
+    if compress:
+        compression.compress(part, path)
+        part.unlink()
+    else:
+        os.replace(part, path)
+
+    metadata = metadata.pop("partial", {})
+    metadata["checked"] = time.time()
+    save_metadata(path, metadata)
+    return True
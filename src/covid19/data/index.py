@@ -0,0 +1,99 @@
+"""
+Index of the byte ranges occupied by each value of a CSV column.
+
+Rows with the same value are usually stored together, so the index is a short
+list of (start, end) offsets per value. Reading those ranges yields exactly
+the rows for that value without scanning the rest of the file.
+"""
+
+import csv
+from dataclasses import asdict
+import json
+import os
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from .. import cache
+
+
+Ranges = List[Tuple[int, int]]
+Index = Dict[str, Ranges]
+
+
+def read_header(fp: BinaryIO) -> List[str]:
+    """Read the header row, leaving the file positioned at the first record."""
+    fp.seek(0)
+    return next(csv.reader([fp.readline().decode("utf-8-sig")]))
+
+
+def read_lines(fp: BinaryIO, start: int, end: int) -> Iterator[str]:
+    """Yield the lines starting in [start, end), with start on a line boundary."""
+    fp.seek(start)
+    offset = start
+    while offset < end:
+        line = fp.readline()
+        if not line:
+            break
+        offset += len(line)
+        yield line.decode()
+
+
+def split(fp: BinaryIO, count: int) -> Ranges:
+    """Divide the records into at most `count` ranges starting on line boundaries."""
+    read_header(fp)
+    start = fp.tell()
+    size = fp.seek(0, os.SEEK_END)
+    bounds = [start]
+    for number in range(1, count):
+        fp.seek(max(start + (size - start) * number // count, bounds[-1]) - 1)
+        fp.readline()
+        bounds.append(min(fp.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+
+def get_field(line: bytes, column: int) -> str:
+    if b'"' in line:
+        return next(csv.reader([line.decode()]))[column]
+    return line.split(b",", column + 1)[column].decode()
+
+
+def build(fp: BinaryIO, column: str) -> Index:
+    """Scan the file once, recording where each value of `column` occurs."""
+    position = read_header(fp).index(column)
+    offset = fp.tell()
+    index: Index = {}
+    for line in iter(fp.readline, b""):
+        ranges = index.setdefault(get_field(line, position), [])
+        if ranges and ranges[-1][1] == offset:
+            ranges[-1] = (ranges[-1][0], offset + len(line))
+        else:
+            ranges.append((offset, offset + len(line)))
+        offset += len(line)
+    return index
+
+
+def write(path: Path, source: Path, index: Index) -> None:
+    data = {"key": asdict(cache.make_key(source)), "index": index}
+    with cache.atomic_write(path) as fp:
+        json.dump(data, fp)
+
+
+def read(path: Path, source: Path) -> Optional[Index]:
+    """Load the index, or return None if it is missing or out of date."""
+    if not path.exists() or not source.exists():
+        return None
+
+    with open(path) as fp:
+        try:
+            data = json.load(fp)
+        except ValueError:
+            return None
+
+    if not cache.is_valid(cache.Key(**data["key"]), source):
+        return None
+
+    return {
+        value: [(start, end) for start, end in ranges]
+        for value, ranges in data["index"].items()
+    }
@@ -1,32 +1,110 @@
 """Data from Johns Hopkins via simonw/covid-19-datasette."""
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 import datetime
-from typing import Any, Iterator, List, Optional, Sequence
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import quote
 
+import appdirs
 import dateparser
 import desert
 import marshmallow
 import requests
 
-from . import populations
+from . import download, populations
+from .. import cache
 from ..populations import Population
 
 
-url = (
-    "https://covid-19.datasettes.com/covid/daily_reports.json?country_or_region={name}"
+url = "https://covid-19.datasettes.com/covid/daily_reports.json"
+cachedir = (
+    Path(appdirs.user_cache_dir(appname="covid19", appauthor="cjolowicz")) / "jhu"
 )
+first_day = datetime.date(2020, 1, 1)
+max_workers = 8
+publication_lag = datetime.timedelta(days=3)
+
+
+def months(
+    start: datetime.date, end: datetime.date
+) -> Iterator[Tuple[datetime.date, datetime.date]]:
+    while start < end:
+        following = (start.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+        yield start, min(following, end)
+        start = following
+
+
+def request_pages(session: requests.Session, params: Dict[str, str]) -> Iterator[Any]:
+    """Yield each page of a datasette query, following its next_url links."""
+    next_url: Optional[str] = url
+    while next_url is not None:
+        with session.get(next_url, params=params) as response:
+            response.raise_for_status()
+            page = response.json()
+        yield page
+        next_url, params = page.get("next_url"), None
+
+
+def request_window(
+    session: requests.Session, name: str, start: datetime.date, end: datetime.date
+) -> Any:
+    """Fetch the rows for days in [start, end), from disk if cached.
+
+    Windows are cached only once they lie `publication_lag` in the past, so
+    that days published late are not missing from the cache for good.
+    """
+    cachefile = cachedir / f"{quote(name, safe='')}-{start:%Y%m%d}-{end:%Y%m%d}.json"
+    if cachefile.exists():
+        with open(cachefile) as fp:
+            return json.load(fp)
+
+    params = {
+        "country_or_region": name,
+        "day__gte": start.isoformat(),
+        "day__lt": end.isoformat(),
+        "_sort": "rowid",
+        "_size": "max",
+    }
+    data: Dict[str, Any] = {"columns": [], "rows": []}
+    for page in request_pages(session, params):
+        data["columns"] = page["columns"]
+        data["rows"] += page["rows"]
+
+    if end + publication_lag <= datetime.date.today():
+        cachedir.mkdir(parents=True, exist_ok=True)
+        with cache.atomic_write(cachefile) as fp:
+            json.dump(data, fp)
+
+    return data
 
 
 def request_data(name: str) -> Any:
-    with requests.get(url.format(name=name)) as response:
-        response.raise_for_status()
-        return response.json()
+    """Fetch the full history, one month per request chain, concurrently."""
+    end = datetime.date.today() + datetime.timedelta(days=1)
+    windows = list(months(first_day, end))
+    with download.create_session(max_workers) as session, ThreadPoolExecutor(
+        max_workers
+    ) as executor:
+        results = list(
+            executor.map(lambda window: request_window(session, name, *window), windows)
+        )
+
+    columns = next((data["columns"] for data in results if data["columns"]), [])
+    return {
+        "columns": columns,
+        "rows": [row for data in results for row in data["rows"]],
+    }
 
 
 class DateTime(marshmallow.fields.DateTime):
-    def _deserialize(value, *args, **kwargs):
-        return dateparser.parse(str(value))
+    def _deserialize(self, value, *args, **kwargs):
+        try:
+            return datetime.datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return dateparser.parse(str(value))
 
 
 @dataclass
@@ -60,6 +138,29 @@ def load_records(data: Any) -> Iterator[Record]:
             raise ValueError(f"bad record: {mapping}") from error
 
 
+def load_series(data: Any) -> Population:
+    """Sum confirmed cases per day straight from the datasette rows.
+
+    Only the day, confirmed and country_or_region columns are decoded.
+    """
+    columns = data["columns"]
+    day, confirmed, country = (
+        columns.index(column) for column in ("day", "confirmed", "country_or_region")
+    )
+    timeseries = defaultdict(int)
+    for row in data["rows"]:
+        timeseries[row[day]] += row[confirmed] or 0
+
+    days = sorted(timeseries)
+    name = data["rows"][0][country]
+    return Population(
+        name=name,
+        population=populations.load(name),
+        start=datetime.date.fromisoformat(days[0]),
+        cases=[timeseries[day] for day in days],
+    )
+
+
 def load_population(records: Iterator[Record]) -> Population:
     records = sorted(records, key=lambda record: record.day)
     timeseries = defaultdict(int)
@@ -68,11 +169,15 @@ def load_population(records: Iterator[Record]) -> Population:
     first = records[0]
     name = first.country_or_region
     population = populations.load(name)
-    cases = timeseries.values()
+    cases = list(timeseries.values())
     return Population(name=name, population=population, start=first.day, cases=cases)
 
 
-def load(name: str) -> Population:
+def load(name: str, strict: bool = False) -> Population:
+    """Load the history of a country; with `strict`, validate every record."""
     data = request_data(name)
+    if not strict:
+        return load_series(data)
+
     records = load_records(data)
     return load_population(records)
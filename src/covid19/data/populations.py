@@ -1,42 +1,35 @@
 """Data from World Bank via datasets/population."""
 
-from collections import defaultdict
 import csv
-from dataclasses import dataclass
-import io
+from dataclasses import asdict, dataclass
+import functools
+import json
 from pathlib import Path
-from typing import Dict, Iterator
+from typing import Dict, Iterator, Optional, TextIO
 
 import appdirs
-import requests
 import desert
 import marshmallow
 
+from . import compression, download
+from .. import cache
+
 
 url = "https://raw.githubusercontent.com/datasets/population/master/data/population.csv"
 cachedir = Path(appdirs.user_cache_dir(appname="covid19", appauthor="cjolowicz"))
-cachefile = cachedir / "population.csv"
-
-
-def load_data() -> str:
-    with requests.get(url) as response:
-        response.raise_for_status()
-        return response.text
+cachefile = cachedir / "population.csv.gz"
+indexfile = cachedir / "population.json"
 
 
-def update_cache() -> str:
-    data = load_data()
-    cachedir.mkdir(parents=True, exist_ok=True)
-    with open(cachefile, mode="w") as fp:
-        return fp.write(data)
+def update_cache() -> bool:
+    return download.download(url, cachefile, compress=True)
 
 
-def load_cache() -> str:
+def load_cache() -> TextIO:
     if not cachefile.exists():
         update_cache()
 
-    with open(cachefile) as fp:
-        return fp.read()
+    return compression.open_text(cachefile)
 
 
 @dataclass
@@ -50,8 +43,8 @@ class Record:
 schema = desert.schema(Record)
 
 
-def load_records(data: str) -> Iterator[Record]:
-    reader = csv.DictReader(io.StringIO(data))
+def load_records(fp: TextIO) -> Iterator[Record]:
+    reader = csv.DictReader(fp)
     for row in reader:
         try:
             yield schema.load(row)
@@ -59,19 +52,51 @@ def load_records(data: str) -> Iterator[Record]:
             print(row, error)
 
 
+def build_index() -> Dict[str, int]:
+    """Map each country to its population in the latest year on record."""
+    latest: Dict[str, Record] = {}
+    with load_cache() as fp:
+        for record in load_records(fp):
+            current = latest.get(record.country_name)
+            if current is None or record.year > current.year:
+                latest[record.country_name] = record
+
+    return {country: int(record.value) for country, record in latest.items()}
+
+
+def read_index() -> Optional[Dict[str, int]]:
+    if not indexfile.exists() or not cachefile.exists():
+        return None
+
+    with open(indexfile) as fp:
+        try:
+            data = json.load(fp)
+        except ValueError:
+            return None
+
+    if not cache.is_valid(cache.Key(**data["key"]), cachefile):
+        return None
+
+    return data["populations"]
+
+
+def write_index(populations: Dict[str, int]) -> None:
+    data = {"key": asdict(cache.make_key(cachefile)), "populations": populations}
+    with cache.atomic_write(indexfile) as fp:
+        json.dump(data, fp)
+
+
+@functools.lru_cache(maxsize=None)
 def load_all() -> Dict[str, int]:
-    data = load_cache()
-    records = load_records(data)
-    countries = defaultdict(list)
-    for record in records:
-        countries[record.country_name].append(record)
-
-    def latest_value(records):
-        return max(records, key=lambda record: record.year).value
-
-    return {
-        country: int(latest_value(records)) for country, records in countries.items()
-    }
+    if not cachefile.exists():
+        update_cache()
+
+    populations = read_index()
+    if populations is None:
+        populations = build_index()
+        write_index(populations)
+
+    return populations
 
 
 name_mapping = {
@@ -0,0 +1,126 @@
+"""
+Registry of data sources with a process-wide memo of loaded populations.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import datetime
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from . import api, jhu, rki, rki_arcgis
+from ..populations import Population
+
+
+@dataclass(frozen=True)
+class Source:
+    """A data source and its capabilities.
+
+    `load_all` is set if the source can produce every population in one pass;
+    `parallel` is set if its loaders accept a `jobs` argument.
+    """
+
+    name: str
+    load: Callable[..., Population]
+    load_all: Optional[Callable[..., List[Population]]] = None
+    parallel: bool = False
+
+    def call(self, function: Callable, *args, jobs: int = 1):
+        return function(*args, jobs=jobs) if self.parallel else function(*args)
+
+
+class Memo:
+    """LRU cache of populations whose entries expire after `ttl`."""
+
+    def __init__(
+        self, maxsize: int = 128, ttl: datetime.timedelta = datetime.timedelta(hours=1)
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: "OrderedDict[Tuple[str, str], Tuple[float, Population]]" = (
+            OrderedDict()
+        )
+
+    def get(self, source: str, name: str) -> Optional[Population]:
+        key = (source, name.lower())
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        timestamp, population = entry
+        if time.monotonic() - timestamp > self.ttl.total_seconds():
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return population
+
+    def put(self, source: str, population: Population) -> None:
+        key = (source, population.name.lower())
+        self.entries[key] = (time.monotonic(), population)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+sources: Dict[str, Source] = {}
+memo = Memo()
+
+
+def register(source: Source) -> None:
+    sources[source.name] = source
+
+
+register(Source("api", api.load, api.load_all))
+register(Source("jhu", jhu.load))
+register(Source("rki", rki.load, lambda: rki.populations))
+register(Source("rki_arcgis", rki_arcgis.load, rki_arcgis.load_all, parallel=True))
+register(Source("rki_sqlite", rki_arcgis.load_from_store))
+
+
+def get_source(source: str) -> Source:
+    try:
+        return sources[source]
+    except KeyError:
+        raise ValueError(f"invalid source {source}") from None
+
+
+def load(name: str, source: str = "rki", jobs: int = 1) -> Population:
+    _source = get_source(source)
+    population = memo.get(source, name)
+    if population is None:
+        population = _source.call(_source.load, name, jobs=jobs)
+        memo.put(source, population)
+
+    return population
+
+
+def load_many(
+    names: Iterable[str], source: str = "rki", jobs: int = 1
+) -> List[Population]:
+    """Load several populations, parsing the source at most once."""
+    _source = get_source(source)
+    names = list(names)
+    found = {name: memo.get(source, name) for name in names}
+    missing = [name for name, population in found.items() if population is None]
+
+    if missing and _source.load_all is not None:
+        populations = {
+            population.name.lower(): population
+            for population in _source.call(_source.load_all, jobs=jobs)
+        }
+        for population in populations.values():
+            memo.put(source, population)
+        for name in missing:
+            if name.lower() not in populations:
+                raise ValueError(f"unknown population {name}")
+            found[name] = populations[name.lower()]
+    else:
+        for name in missing:
+            found[name] = _source.call(_source.load, name, jobs=jobs)
+            memo.put(source, found[name])
+
+    return [found[name] for name in names]
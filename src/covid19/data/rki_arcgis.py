@@ -3,26 +3,30 @@ Data from RKI dataset via ArcGIS Online.
 """
 
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 import csv
 from dataclasses import dataclass
 import datetime
-from itertools import chain
-import io
+from itertools import chain, repeat
 from pathlib import Path
-from typing import Iterator, List, Sequence, TextIO
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
 
 import appdirs
 import dateutil.tz
-import requests
 import marshmallow as ma
 from more_itertools import pairwise
 
+from . import compression, cube, download, index, series, store
 from ..populations import Population
 
 
 url = "https://opendata.arcgis.com/datasets/dd4580c810204019a7b8eb3e0b329dd6_0.csv"
 cachedir = Path(appdirs.user_cache_dir(appname="covid19", appauthor="cjolowicz"))
-cachefile = cachedir / "covid19.csv"
+cachefile = cachedir / "covid19.csv.gz"
+seriesfile = cachedir / "covid19.series"
+indexfile = cachedir / "covid19.index"
+storefile = cachedir / "covid19.sqlite"
 
 
 # https://de.wikipedia.org/wiki/Liste_der_deutschen_Bundesl%C3%A4nder_nach_Bev%C3%B6lkerung
@@ -64,6 +68,9 @@ class Record:
     version: datetime.datetime
 
 
+VERSION_FORMAT = "%d.%m.%Y %H:%M"
+
+
 class RecordSchema(ma.Schema):
     object_id = ma.fields.Int(data_key="ObjectId")
     state_id = ma.fields.Int(data_key="IdBundesland")
@@ -75,7 +82,7 @@ class RecordSchema(ma.Schema):
     cases = ma.fields.Int(data_key="AnzahlFall")
     deceased = ma.fields.Int(data_key="AnzahlTodesfall")
     date = ma.fields.DateTime(data_key="Meldedatum")
-    version = ma.fields.DateTime(data_key="Datenstand", format="%d.%m.%Y %H:%M")
+    version = ma.fields.DateTime(data_key="Datenstand", format=VERSION_FORMAT)
 
     @ma.post_load
     def post_load(self, data, **kwargs):
@@ -84,88 +91,326 @@ class RecordSchema(ma.Schema):
 
 schema = RecordSchema()
 
+Table = Dict[str, Dict[datetime.date, int]]
+
+
+@dataclass
+class Summary:
+    records: int = 0
+    errors: int = 0
+
+    def report(self) -> None:
+        if self.errors:
+            print(
+                f"skipped {self.errors} of {self.records} bad records", file=sys.stderr,
+            )
 
-def load_records(data: str) -> Iterator[Record]:
-    reader = csv.DictReader(io.StringIO(data))
+
+def load_records(fp: TextIO, summary: Optional[Summary] = None) -> Iterator[Record]:
+    summary = summary if summary is not None else Summary()
+    reader = csv.DictReader(fp)
     for row in reader:
+        summary.records += 1
         if row["IdLandkreis"] == "0-1":
             row["IdLandkreis"] = "-1"
         if "Empfagen" in row:
             del row["Empfagen"]
         try:
             yield schema.load(row)
-        except ma.exceptions.ValidationError as error:
-            print(row, error)
+        except ma.exceptions.ValidationError:
+            summary.errors += 1
 
 
-def load_populations(records: Sequence[Record]) -> Iterator[Population]:
+def aggregate(records: Iterable[Record]) -> Table:
     table = defaultdict(lambda: defaultdict(int))
     for record in records:
-        table[record.state][record.date] += record.cases
-        table["Germany"][record.date] += record.cases
+        table[record.state][record.date.date()] += record.cases
+    return table
+
+
+def read_table(rows: Iterable[List[str]], header: List[str], summary: Summary) -> Table:
+    """Sum cases per state and date, parsing only the columns needed for that."""
+    state, date, cases = (
+        header.index(column) for column in ("Bundesland", "Meldedatum", "AnzahlFall")
+    )
+    dates: Dict[str, datetime.date] = {}
+    table = defaultdict(lambda: defaultdict(int))
+    for row in rows:
+        summary.records += 1
+        try:
+            day = dates.get(row[date])
+            if day is None:
+                day = dates[row[date]] = datetime.date.fromisoformat(row[date][:10])
+            table[row[state]][day] += int(row[cases])
+        except (IndexError, ValueError):
+            summary.errors += 1
+    return table
 
-    for state, points in table.items():
-        dates = sorted(points)
-        population = Population(
-            name=state, population=populations[state], start=dates[0].date(), cases=[]
-        )
 
-        cases = 0
-        for previous, date in pairwise(chain([None], dates)):
-            if previous is not None:
-                for _ in range((date - previous).days - 1):
-                    population.cases.append(cases)
+def load_table(fp: TextIO, summary: Optional[Summary] = None) -> Table:
+    summary = summary if summary is not None else Summary()
+    reader = csv.reader(fp)
+    header = next(reader)
+    return read_table(reader, header, summary)
 
-            cases += points[date]
-            population.cases.append(cases)
 
-        yield population
+def parse_range(
+    path: Path, start: int, end: int
+) -> Tuple[Dict[str, Dict[datetime.date, int]], Summary]:
+    summary = Summary()
+    with compression.open_binary(path) as fp:
+        header = index.read_header(fp)
+        rows = csv.reader(index.read_lines(fp, start, end))
+        table = read_table(rows, header, summary)
 
+    return {state: dict(points) for state, points in table.items()}, summary
 
-def load_data() -> str:
-    with requests.get(url) as response:
-        response.encoding = None  # https://github.com/psf/requests/issues/654
-        response.raise_for_status()
-        return response.text
 
+def load_table_parallel(path: Path, jobs: int, summary: Summary) -> Table:
+    """Parse byte ranges of the file in worker processes and merge the sums.
 
-def update_cache() -> str:
-    data = load_data()
-    cachedir.mkdir(parents=True, exist_ok=True)
-    with open(cachefile, mode="w") as fp:
-        return fp.write(data)
+    Ranges are merged in file order, so the result equals that of load_table.
+    """
+    with compression.open_binary(path) as fp:
+        ranges = index.split(fp, 4 * jobs)
+
+    table = defaultdict(lambda: defaultdict(int))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        starts, ends = zip(*ranges) if ranges else ((), ())
+        for partial, partial_summary in executor.map(
+            parse_range, repeat(path), starts, ends
+        ):
+            for state, points in partial.items():
+                totals = table[state]
+                for date, cases in points.items():
+                    totals[date] += cases
+            summary.records += partial_summary.records
+            summary.errors += partial_summary.errors
+
+    return table
+
+
+def cube_rows(records: Iterable[Record]) -> Iterator[cube.Row]:
+    for record in records:
+        yield (
+            record.state,
+            record.district_id,
+            record.district,
+            record.age_group,
+            record.gender,
+            record.date.date(),
+            record.cases,
+            record.deceased,
+        )
+
+
+def read_cube_rows(
+    rows: Iterable[List[str]], header: List[str], summary: Summary
+) -> Iterator[cube.Row]:
+    """Extract cube coordinates and measures, parsing only those columns."""
+    columns = [
+        header.index(column)
+        for column in (
+            "Bundesland",
+            "IdLandkreis",
+            "Landkreis",
+            "Altersgruppe",
+            "Geschlecht",
+            "Meldedatum",
+            "AnzahlFall",
+            "AnzahlTodesfall",
+        )
+    ]
+    dates: Dict[str, datetime.date] = {}
+    for row in rows:
+        summary.records += 1
+        try:
+            state, district_id, district, age_group, gender, date, cases, deceased = (
+                row[column] for column in columns
+            )
+            day = dates.get(date)
+            if day is None:
+                day = dates[date] = datetime.date.fromisoformat(date[:10])
+            yield (
+                state,
+                -1 if district_id == "0-1" else int(district_id),
+                district,
+                age_group,
+                gender,
+                day,
+                int(cases),
+                int(deceased),
+            )
+        except (IndexError, ValueError):
+            summary.errors += 1
+
+
+def load_populations(table: Table) -> Iterator[Population]:
+    if not table:
+        return
+
+    germany = defaultdict(int)
+    for points in table.values():
+        for date, cases in points.items():
+            germany[date] += cases
+
+    for state, points in chain(table.items(), [("Germany", germany)]):
+        yield load_population(state, points)
+
+
+def load_population(state: str, points: Dict[datetime.date, int]) -> Population:
+    dates = sorted(points)
+    cases = []
+    total = 0
+    for previous, date in pairwise(chain([None], dates)):
+        if previous is not None:
+            for _ in range((date - previous).days - 1):
+                cases.append(total)
+
+        total += points[date]
+        cases.append(total)
+
+    return Population(
+        name=state, population=populations[state], start=dates[0], cases=cases
+    )
+
+
+def update_cache() -> bool:
+    return download.download(url, cachefile, compress=True)
 
 
 def is_cache_expired() -> bool:
-    if not cachefile.exists():
+    checked = download.last_checked(cachefile)
+    if checked is None:
         return True
 
-    mtime = cachefile.stat().st_mtime
     tz = dateutil.tz.gettz()
     now = datetime.datetime.now(tz=tz)
-    last_updated = datetime.datetime.fromtimestamp(mtime, tz=tz)
+    last_updated = datetime.datetime.fromtimestamp(checked, tz=tz)
 
     return now.date() > last_updated.date()
 
 
-def load_cache() -> str:
+def load_cache() -> TextIO:
+    if is_cache_expired():
+        update_cache()
+
+    return compression.open_text(cachefile)
+
+
+def parse_cache(jobs: int = 1) -> List[Population]:
+    summary = Summary()
+    if jobs > 1:
+        if is_cache_expired():
+            update_cache()
+        table = load_table_parallel(cachefile, jobs, summary)
+    else:
+        with load_cache() as fp:
+            table = load_table(fp, summary)
+    summary.report()
+
+    populations = list(load_populations(table))
+    series.write(seriesfile, cachefile, populations)
+
+    return populations
+
+
+def load_series(name: Optional[str] = None) -> Optional[List[Population]]:
     if is_cache_expired():
         update_cache()
 
-    with open(cachefile) as fp:
-        return fp.read()
+    return series.read(seriesfile, cachefile, name)
+
+
+def load_all(jobs: int = 1) -> List[Population]:
+    populations = load_series()
+    if populations is None:
+        populations = parse_cache(jobs)
+
+    return populations
+
+
+def load_cube() -> cube.Cube:
+    summary = Summary()
+    with load_cache() as fp:
+        reader = csv.reader(fp)
+        header = next(reader)
+        result = cube.build(read_cube_rows(reader, header, summary))
+    summary.report()
+
+    return result
+
 
+def load_store() -> store.Store:
+    """Open the SQLite store, ingesting the cached dataset if its version is new."""
+    result = store.Store(storefile)
+    summary = Summary()
+    with load_cache() as fp:
+        reader = csv.reader(fp)
+        header = next(reader)
+        first = next(reader, None)
+        if first is not None:
+            version = datetime.datetime.strptime(
+                first[header.index("Datenstand")], VERSION_FORMAT
+            )
+            rows = read_cube_rows(chain([first], reader), header, summary)
+            result.ingest(version, rows)
+    summary.report()
 
-def load_all() -> List[Population]:
-    data = load_cache()
-    records = load_records(data)
-    populations = load_populations(records)
+    return result
 
-    return list(populations)
 
+def load_from_store(
+    name: str, version: Optional[datetime.datetime] = None
+) -> Population:
+    for state in populations:
+        if name.lower() == state.lower():
+            break
+    else:
+        raise ValueError(f"unknown population {name}")
 
-def load(name: str) -> Population:
-    populations = load_all()
+    with load_store() as _store:
+        return _store.population(
+            state, populations[state], state=state, version=version
+        )
+
+
+def load_index() -> index.Index:
+    result = index.read(indexfile, cachefile)
+    if result is None:
+        with compression.open_binary(cachefile) as fp:
+            result = index.build(fp, "Bundesland")
+        index.write(indexfile, cachefile, result)
+
+    return result
+
+
+def load_state(name: str) -> Population:
+    """Aggregate a single state, reading only the rows recorded in the index."""
+    for state, ranges in load_index().items():
+        if name.lower() == state.lower():
+            break
+    else:
+        raise ValueError(f"unknown population {name}")
+
+    summary = Summary()
+    with compression.open_binary(cachefile) as fp:
+        header = index.read_header(fp)
+        lines = chain.from_iterable(
+            index.read_lines(fp, start, end) for start, end in ranges
+        )
+        table = read_table(csv.reader(lines), header, summary)
+    summary.report()
+
+    return load_population(state, table[state])
+
+
+def load(name: str, jobs: int = 1) -> Population:
+    populations = load_series(name)
+    if populations is None:
+        populations = (
+            parse_cache(jobs) if name.lower() == "germany" else [load_state(name)]
+        )
 
     for population in populations:
         if name.lower() == population.name.lower():
@@ -0,0 +1,95 @@
+"""
+Binary cache of aggregated time series, keyed on the file they were derived from.
+
+The cache file starts with a JSON header line describing the source file and
+each series, followed by the cumulative case counts as little-endian int64.
+"""
+
+from dataclasses import asdict
+import datetime
+import json
+from pathlib import Path
+from typing import BinaryIO, Iterable, List, Optional
+
+import numpy as np
+
+from .. import cache
+from ..populations import Population
+
+
+VERSION = 1
+DTYPE = np.dtype("<i8")
+
+
+def write(path: Path, source: Path, populations: Iterable[Population]) -> None:
+    key = cache.make_key(source)
+    populations = list(populations)
+    header = {
+        "version": VERSION,
+        "key": asdict(key),
+        "series": [
+            {
+                "name": population.name,
+                "population": population.population,
+                "start": population.start.isoformat(),
+                "length": len(population.cases),
+            }
+            for population in populations
+        ],
+    }
+
+    with cache.atomic_write(path, mode="wb") as fp:
+        fp.write(json.dumps(header).encode())
+        fp.write(b"\n")
+        for population in populations:
+            fp.write(population.cases.astype(DTYPE).tobytes())
+
+
+def read_header(fp: BinaryIO, source: Path) -> Optional[dict]:
+    try:
+        header = json.loads(fp.readline())
+    except ValueError:
+        return None
+
+    if header.get("version") != VERSION or not cache.is_valid(
+        cache.Key(**header["key"]), source
+    ):
+        return None
+
+    return header
+
+
+def read_series(fp: BinaryIO, entry: dict) -> Population:
+    cases = np.frombuffer(fp.read(entry["length"] * DTYPE.itemsize), dtype=DTYPE)
+    return Population(
+        name=entry["name"],
+        population=entry["population"],
+        start=datetime.date.fromisoformat(entry["start"]),
+        cases=cases,
+    )
+
+
+def read(
+    path: Path, source: Path, name: Optional[str] = None
+) -> Optional[List[Population]]:
+    """Load the cached series, or only the one called `name`.
+
+    Returns None if the cache is missing or was built from a different source.
+    """
+    if not path.exists() or not source.exists():
+        return None
+
+    with open(path, mode="rb") as fp:
+        header = read_header(fp, source)
+        if header is None:
+            return None
+
+        populations = []
+        offset = fp.tell()
+        for entry in header["series"]:
+            if name is None or name.lower() == entry["name"].lower():
+                fp.seek(offset)
+                populations.append(read_series(fp, entry))
+            offset += entry["length"] * DTYPE.itemsize
+
+        return populations
@@ -0,0 +1,213 @@
+"""
+SQLite store of RKI case counts, versioned by Datenstand.
+
+Counts are kept per district, age group, gender and date, where a district is
+identified by its state, ID and name, as in the cube. Each row is valid for a
+contiguous range of ingested versions, so a refresh only extends rows that did
+not change and inserts the ones that did, and any past version can still be
+queried.
+"""
+
+from collections import defaultdict
+import datetime
+from pathlib import Path
+import sqlite3
+from typing import Iterable, List, Optional, Tuple
+
+from . import cube
+from ..populations import Population
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    id INTEGER PRIMARY KEY,
+    version TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS counts (
+    state TEXT NOT NULL,
+    district_id INTEGER NOT NULL,
+    district TEXT NOT NULL,
+    age_group TEXT NOT NULL,
+    gender TEXT NOT NULL,
+    date TEXT NOT NULL,
+    cases INTEGER NOT NULL,
+    deceased INTEGER NOT NULL,
+    first_version INTEGER NOT NULL REFERENCES versions (id),
+    last_version INTEGER NOT NULL REFERENCES versions (id)
+);
+CREATE INDEX IF NOT EXISTS counts_state ON counts (state, date);
+CREATE INDEX IF NOT EXISTS counts_district ON counts (district_id, date);
+CREATE INDEX IF NOT EXISTS counts_date ON counts (date);
+DROP INDEX IF EXISTS counts_cell;
+CREATE INDEX IF NOT EXISTS counts_key ON counts (
+    district_id, district, state, age_group, gender, date, last_version
+);
+"""
+
+
+class Store:
+    """Versioned case counts in a SQLite database."""
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(path))
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> "Store":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def versions(self) -> List[datetime.datetime]:
+        rows = self.connection.execute("SELECT version FROM versions ORDER BY id")
+        return [datetime.datetime.fromisoformat(version) for version, in rows]
+
+    def _version_id(self, version: Optional[datetime.datetime]) -> Optional[int]:
+        if version is None:
+            row = self.connection.execute("SELECT MAX(id) FROM versions").fetchone()
+        else:
+            row = self.connection.execute(
+                "SELECT id FROM versions WHERE version = ?", (version.isoformat(),)
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"unknown version {version}")
+        return row[0]
+
+    def ingest(self, version: datetime.datetime, rows: Iterable[cube.Row]) -> bool:
+        """Add a dataset version, unless it was already ingested.
+
+        Returns True if the version was new.
+        """
+        if version in self.versions():
+            return False
+
+        cells = defaultdict(lambda: [0, 0])
+        for state, district_id, district, age_group, gender, date, *measures in rows:
+            cell = cells[
+                state, district_id, district, age_group, gender, date.isoformat()
+            ]
+            cell[0] += measures[0]
+            cell[1] += measures[1]
+
+        with self.connection:
+            previous = self._version_id(None)
+            current = self.connection.execute(
+                "INSERT INTO versions (version) VALUES (?)", (version.isoformat(),)
+            ).lastrowid
+            self.connection.execute(
+                """
+                CREATE TEMPORARY TABLE incoming (
+                    state, district_id, district, age_group, gender, date,
+                    cases, deceased
+                )
+                """
+            )
+            self.connection.executemany(
+                "INSERT INTO incoming VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                ((*cell, cases, deceased) for cell, (cases, deceased) in cells.items()),
+            )
+            self.connection.execute(
+                """
+                UPDATE counts SET last_version = :current
+                WHERE rowid IN (
+                    SELECT c.rowid FROM incoming AS i
+                    JOIN counts AS c
+                    ON c.district_id = i.district_id
+                    AND c.district = i.district
+                    AND c.state = i.state
+                    AND c.age_group = i.age_group
+                    AND c.gender = i.gender
+                    AND c.date = i.date
+                    AND c.last_version = :previous
+                    WHERE c.cases = i.cases AND c.deceased = i.deceased
+                )
+                """,
+                {"current": current, "previous": previous},
+            )
+            self.connection.execute(
+                """
+                INSERT INTO counts
+                SELECT i.*, :current, :current FROM incoming AS i
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM counts AS c
+                    WHERE c.district_id = i.district_id
+                    AND c.district = i.district
+                    AND c.state = i.state
+                    AND c.age_group = i.age_group
+                    AND c.gender = i.gender
+                    AND c.date = i.date
+                    AND c.last_version = :current
+                )
+                """,
+                {"current": current},
+            )
+            self.connection.execute("DROP TABLE incoming")
+
+        return True
+
+    def query(
+        self,
+        *,
+        state: Optional[str] = None,
+        district: Optional[object] = None,
+        start: Optional[datetime.date] = None,
+        end: Optional[datetime.date] = None,
+        version: Optional[datetime.datetime] = None,
+    ) -> List[Tuple[datetime.date, int, int]]:
+        """Return (date, cases, deceased) per day for a region and date range.
+
+        `district` is either the district ID or its exact name. Counts are as of
+        `version`, or of the latest version by default.
+        """
+        conditions = ["first_version <= :version", "last_version >= :version"]
+        parameters = {"version": self._version_id(version)}
+        if state is not None and state.lower() != "germany":
+            conditions.append("state = :state")
+            parameters["state"] = state
+        if isinstance(district, int):
+            conditions.append("district_id = :district")
+            parameters["district"] = district
+        elif district is not None:
+            conditions.append("district = :district")
+            parameters["district"] = district
+        if start is not None:
+            conditions.append("date >= :start")
+            parameters["start"] = start.isoformat()
+        if end is not None:
+            conditions.append("date <= :end")
+            parameters["end"] = end.isoformat()
+
+        rows = self.connection.execute(
+            f"""
+            SELECT date, SUM(cases), SUM(deceased) FROM counts
+            WHERE {" AND ".join(conditions)}
+            GROUP BY date ORDER BY date
+            """,
+            parameters,
+        )
+        return [
+            (datetime.date.fromisoformat(date), cases, deceased)
+            for date, cases, deceased in rows
+        ]
+
+    def population(
+        self, name: str, population: int, measure: str = "cases", **selection
+    ) -> Population:
+        """Return a cumulative series for a region, filling days without counts."""
+        rows = self.query(**selection)
+        if not rows:
+            raise ValueError(f"unknown population {name}")
+
+        column = 1 if measure == "cases" else 2
+        start = rows[0][0]
+        cases = [0] * ((rows[-1][0] - start).days + 1)
+        for row in rows:
+            cases[(row[0] - start).days] = row[column]
+        for days in range(1, len(cases)):
+            cases[days] += cases[days - 1]
+
+        return Population(name=name, population=population, start=start, cases=cases)
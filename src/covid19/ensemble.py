@@ -0,0 +1,452 @@
+"""
+Ensemble of simulations advanced in lockstep.
+
+Observed data is replayed with array arithmetic, sharing the geometric mean
+estimate of the scalar Simulation. The forecast phase then runs for all members at
+once on arrays, using the same floating-point operations as Simulation.step(),
+so each trajectory equals the one simulate() would produce. Alternatively,
+sample() draws stochastic forecasts and reduces them to quantile bands.
+"""
+
+from dataclasses import dataclass
+import datetime
+from math import exp, fsum, log
+from statistics import geometric_mean
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .populations import Population
+from .simulation import (
+    AVERAGE_CASE_DURATION,
+    ETA,
+    GeometricMean,
+    PROBABILITY_WINDOW_SIZE,
+    State,
+)
+
+
+FIELDS = ("days", "infections", "recoveries", "cases", "immune", "probability")
+MEASURES = ("infections", "recoveries", "cases", "immune")
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+@dataclass
+class Run:
+    population: Population
+    with_immunity: bool = True
+    version: Optional[datetime.date] = None
+    end: Optional[datetime.date] = None
+    average_case_duration: int = AVERAGE_CASE_DURATION
+    probability_window_size: int = PROBABILITY_WINDOW_SIZE
+    eta: float = ETA
+
+
+@dataclass
+class Trajectory:
+    days: np.ndarray
+    infections: np.ndarray
+    recoveries: np.ndarray
+    cases: np.ndarray
+    immune: np.ndarray
+    probability: np.ndarray
+
+    def states(self) -> List[State]:
+        columns = (getattr(self, field).tolist() for field in FIELDS)
+        return [State(*values) for values in zip(*columns)]
+
+
+@dataclass
+class Bands:
+    """Quantiles of sampled trajectories, one row per day and column per quantile."""
+
+    days: np.ndarray
+    quantiles: np.ndarray
+    infections: np.ndarray
+    recoveries: np.ndarray
+    cases: np.ndarray
+    immune: np.ndarray
+
+
+@dataclass
+class Summary:
+    """Peak and final values of each trajectory, one array element per run."""
+
+    peak_cases: np.ndarray
+    peak_days: np.ndarray
+    days: np.ndarray
+    immune: np.ndarray
+
+
+def replay(run: Run) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return infections, recoveries and cases per day of the observed data."""
+    duration = run.average_case_duration
+    infections = run.population.as_of(run.version).difference()
+    recoveries = np.zeros_like(infections)
+    recoveries[duration:] = infections[:-duration]
+    cases = np.cumsum(infections - recoveries)
+    return infections, recoveries, cases
+
+
+def estimate(infections: List[int], cases: List[int], size: int) -> np.ndarray:
+    """Return the infection probability after each day, as Simulation.feed() does."""
+    window = GeometricMean(size)
+    probabilities = np.zeros(len(infections))
+    probability = 0.0
+    for day, (count, previous) in enumerate(zip(infections, [0] + cases)):
+        if previous > 0:
+            window.push(count / previous)
+            if window.full():
+                probability = window.mean()
+        probabilities[day] = probability
+    return probabilities
+
+
+def last_window(
+    infections: np.ndarray, cases: np.ndarray, size: int
+) -> Optional[List[float]]:
+    """Return the ratios behind the last estimate, or None if there is none."""
+    previous = np.concatenate([[0], cases])[:-1]
+    pushed = previous > 0
+    ratios = infections[pushed] / previous[pushed]
+
+    def counts(mask: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        total = np.concatenate([[0], np.cumsum(mask)])
+        return total[ends + 1] - total[ends + 1 - size]
+
+    ends = np.arange(size - 1, len(ratios))
+    full = ends[counts(ratios == 0, ends) == 0]
+    if not len(full):
+        return None
+
+    invalid = full[counts(ratios < 0, full) > 0]
+    if len(invalid):
+        end = invalid[0]
+        geometric_mean(ratios[end + 1 - size : end + 1].tolist())  # raises
+
+    end = full[-1]
+    return ratios[end + 1 - size : end + 1].tolist()
+
+
+def latest(infections: np.ndarray, cases: np.ndarray, size: int) -> float:
+    """Return the last value estimate() would produce, without the daily loop."""
+    window = last_window(infections, cases, size)
+    if window is None:
+        return 0.0
+    return exp(fsum(map(log, window)) / size)
+
+
+@dataclass
+class Observation:
+    """The observed part of a run, up to the start of the forecast."""
+
+    infections: np.ndarray
+    recoveries: np.ndarray
+    cases: np.ndarray
+    immune: np.ndarray
+    size: int
+    probability: float
+
+    def last(self, field: str):
+        if field == "days":
+            return len(self.cases)
+        if field == "probability":
+            return self.probability
+        values = getattr(self, field)
+        return values[-1] if len(values) else 0
+
+    def window(self, duration: int) -> np.ndarray:
+        window = np.zeros(duration, dtype=np.int64)
+        recent = self.infections[-duration:]
+        window[duration - len(recent) :] = recent
+        return window
+
+    def trajectory(self) -> Trajectory:
+        probabilities = estimate(
+            self.infections.tolist(), self.cases.tolist(), self.size
+        )
+
+        # Simulation.feed() updates the probability of the state it yielded on
+        # the previous day, so each day carries the estimate of the next.
+        probability = np.concatenate([probabilities[1:], probabilities[-1:]])
+
+        return Trajectory(
+            days=np.arange(1, len(self.cases) + 1, dtype=np.int64),
+            infections=self.infections,
+            recoveries=self.recoveries,
+            cases=self.cases,
+            immune=self.immune,
+            probability=probability,
+        )
+
+
+class Ensemble:
+    """Forecast state of many simulations, one array element per member.
+
+    Each member has a recovery ring buffer of its own length, stored in the
+    leading columns of `window`; the members advance through them in lockstep.
+    Members that have converged are dropped from the arrays as they go, and
+    `members` maps the remaining rows to the runs they came from.
+    """
+
+    arrays = FIELDS + (
+        "population",
+        "with_immunity",
+        "eta",
+        "stops",
+        "durations",
+        "window",
+        "members",
+    )
+
+    def __init__(
+        self, runs: Sequence[Run], random: Optional[np.random.Generator] = None
+    ) -> None:
+        self.random = random
+        replays: Dict[Tuple, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        estimates: Dict[Tuple, float] = {}
+        observations: Dict[Tuple, Observation] = {}
+        self.observations: List[Observation] = []
+        for run in runs:
+            key = (id(run.population), run.version, run.average_case_duration)
+            if key not in replays:
+                replays[key] = replay(run)
+            infections, recoveries, cases = replays[key]
+
+            size = run.probability_window_size
+            if (key, size) not in estimates:
+                estimates[key, size] = latest(infections, cases, size)
+
+            if (key, size, run.with_immunity) not in observations:
+                observations[key, size, run.with_immunity] = Observation(
+                    infections,
+                    recoveries,
+                    cases,
+                    np.cumsum(recoveries)
+                    if run.with_immunity
+                    else np.zeros_like(cases),
+                    size,
+                    estimates[key, size],
+                )
+            self.observations.append(observations[key, size, run.with_immunity])
+
+        self.population = np.array(
+            [run.population.population for run in runs], dtype=np.int64
+        )
+        self.with_immunity = np.array([run.with_immunity for run in runs], dtype=bool)
+        self.eta = np.array([run.eta for run in runs], dtype=np.float64)
+        self.stops = np.array(
+            [
+                max((run.end - run.population.start).days + 1, 0) if run.end else 0
+                for run in runs
+            ],
+            dtype=np.int64,
+        )
+        for field in FIELDS:
+            dtype = np.float64 if field == "probability" else np.int64
+            values = [observation.last(field) for observation in self.observations]
+            setattr(self, field, np.array(values, dtype=dtype))
+
+        self.durations = np.array(
+            [run.average_case_duration for run in runs], dtype=np.intp
+        )
+        self.window = np.zeros(
+            (len(runs), max(self.durations, default=0)), dtype=np.int64
+        )
+        for member, (run, observation) in enumerate(zip(runs, self.observations)):
+            duration = run.average_case_duration
+            self.window[member, :duration] = observation.window(duration)
+        self.members = np.arange(len(runs))
+        self.rows = np.arange(len(runs))
+        self.steps = 0
+
+    def compact(self, keep: np.ndarray) -> None:
+        """Drop the rows of members that are no longer needed."""
+        for name in self.arrays:
+            setattr(self, name, getattr(self, name)[keep])
+        self.rows = np.arange(len(self.members))
+
+    def predict(self, active: np.ndarray) -> np.ndarray:
+        with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+            immunization = self.immune / self.population
+            infestation = self.cases / self.population
+            predicted = (
+                self.cases * self.probability * (1 - (infestation + immunization))
+            )
+        if not (np.abs(predicted[active]) < 2.0 ** 63).all():
+            raise OverflowError("prediction out of range")
+        return np.trunc(predicted).astype(np.int64)
+
+    def sample(self) -> np.ndarray:
+        """Draw infections from a binomial distribution over the susceptibles.
+
+        Each infectious case meets a susceptible person with the estimated
+        probability, so the expected value is the deterministic prediction.
+        """
+        susceptible = np.maximum(self.population - self.cases - self.immune, 0)
+        rate = np.clip(
+            np.maximum(self.cases, 0) * self.probability / self.population, 0, 1
+        )
+        return self.random.binomial(susceptible, rate)
+
+    def step(self, active: np.ndarray) -> None:
+        """Predict infections for a single day, for every member.
+
+        If the ensemble has a random generator, infections are sampled instead.
+        Raises OverflowError if an active member's prediction leaves the
+        int64 range.
+        """
+        if self.random is not None:
+            infections = self.sample()
+        else:
+            infections = self.predict(active)
+
+        head = self.steps % self.durations
+        recoveries = self.window[self.rows, head]
+        self.window[self.rows, head] = infections
+        self.steps += 1
+
+        self.days = self.days + 1
+        self.infections = infections
+        self.recoveries = recoveries
+        self.cases = self.cases + infections - recoveries
+        self.immune = self.immune + np.where(self.with_immunity, recoveries, 0)
+
+    def run(self, max_steps: int = 100_000) -> Iterator[np.ndarray]:
+        """Predict infections, day by day, like simulation.forecast().
+
+        Yields a mask of the rows whose current state belongs to their
+        trajectory; members drop out once they have converged.
+        """
+        active = np.ones(len(self.members), dtype=bool)
+        for step in range(max_steps):
+            if 2 * np.count_nonzero(active) < len(active):
+                self.compact(active)
+                active = active[active]
+
+            previous = self.cases
+            self.step(active)
+            if step > 0:
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    change = np.abs(1 - self.cases / previous)
+                converged = (step > self.stops) & (
+                    (previous == 0) | (change < self.eta)
+                )
+                active = active & ~converged
+            if not active.any():
+                return
+            yield active
+
+
+def simulate(runs: Sequence[Run], max_steps: int = 100_000) -> List[Trajectory]:
+    """Simulate every run, like simulation.simulate(), as one batch."""
+    ensemble = Ensemble(runs)
+    members = []
+    records = []
+    for active in ensemble.run(max_steps):
+        members.append(ensemble.members[active])
+        records.append([getattr(ensemble, field)[active] for field in FIELDS])
+
+    # Group the forecast values by member, keeping them in step order.
+    members = np.concatenate(members) if members else np.zeros(0, dtype=np.intp)
+    order = np.argsort(members, kind="stable")
+    bounds = np.searchsorted(members[order], np.arange(len(runs) + 1))
+    columns = [np.concatenate(values)[order] for values in zip(*records)] or [
+        np.zeros(0)
+    ] * len(FIELDS)
+
+    observed: Dict[int, Trajectory] = {}
+    trajectories = []
+    for member, observation in enumerate(ensemble.observations):
+        if id(observation) not in observed:
+            observed[id(observation)] = observation.trajectory()
+        trajectory = observed[id(observation)]
+        start, stop = bounds[member], bounds[member + 1]
+        arrays = {
+            field: np.concatenate([getattr(trajectory, field), column[start:stop]])
+            for field, column in zip(FIELDS, columns)
+        }
+        trajectories.append(Trajectory(**arrays))
+
+    return trajectories
+
+
+def summarize(runs: Sequence[Run], max_steps: int = 100_000) -> Summary:
+    """Simulate every run, keeping only the peak and final values.
+
+    Unlike simulate(), memory does not grow with the forecast horizon.
+    """
+    ensemble = Ensemble(runs)
+    peaks: Dict[int, Tuple[int, int]] = {}
+    for observation in ensemble.observations:
+        if id(observation.cases) not in peaks:
+            cases = observation.cases
+            day = int(np.argmax(cases)) if len(cases) else -1
+            peaks[id(cases)] = (
+                (cases[day], day + 1) if day >= 0 else (np.iinfo(np.int64).min, 0)
+            )
+    values = [peaks[id(observation.cases)] for observation in ensemble.observations]
+
+    summary = Summary(
+        peak_cases=np.array([cases for cases, _ in values], dtype=np.int64),
+        peak_days=np.array([days for _, days in values], dtype=np.int64),
+        days=ensemble.days.copy(),
+        immune=ensemble.immune.copy(),
+    )
+    for active in ensemble.run(max_steps):
+        members = ensemble.members[active]
+        cases = ensemble.cases[active]
+        higher = cases > summary.peak_cases[members]
+        summary.peak_cases[members[higher]] = cases[higher]
+        summary.peak_days[members[higher]] = ensemble.days[active][higher]
+        summary.days[members] = ensemble.days[active]
+        summary.immune[members] = ensemble.immune[active]
+
+    return summary
+
+
+def spread(run: Run) -> float:
+    """Return the standard error of the log probability estimate of a run."""
+    infections, _, cases = replay(run)
+    size = run.probability_window_size
+    window = last_window(infections, cases, size)
+    if window is None or size < 2:
+        return 0.0
+    return float(np.std(np.log(window), ddof=1) / np.sqrt(size))
+
+
+def sample(
+    run: Run,
+    size: int,
+    steps: int,
+    quantiles: Sequence[float] = QUANTILES,
+    sigma: Optional[float] = None,
+    seed: Optional[int] = None,
+) -> Bands:
+    """Sample `size` stochastic forecasts of a run, for `steps` days.
+
+    Infections are drawn binomially, and each trajectory scales the estimated
+    probability by a log-normal factor with deviation `sigma`, by default the
+    standard error of the estimate. Only the quantiles are kept for each day.
+    """
+    random = np.random.default_rng(seed)
+    ensemble = Ensemble([run] * size, random=random)
+    if sigma is None:
+        sigma = spread(run)
+    ensemble.probability = ensemble.probability * np.exp(
+        sigma * random.standard_normal(size)
+    )
+
+    bands = {measure: np.zeros((steps, len(quantiles))) for measure in MEASURES}
+    active = np.ones(size, dtype=bool)
+    for day in range(steps):
+        ensemble.step(active)
+        for measure, values in bands.items():
+            values[day] = np.quantile(getattr(ensemble, measure), quantiles)
+
+    start = ensemble.observations[0].last("days") + 1
+    return Bands(
+        days=np.arange(start, start + steps, dtype=np.int64),
+        quantiles=np.array(quantiles),
+        **bands,
+    )
@@ -1,11 +1,62 @@
 from dataclasses import dataclass
 import datetime
-from typing import List
+from typing import Optional, Sequence
 
+import numpy as np
 
-@dataclass
+
+@dataclass(eq=False)
 class Population:
+    """Cumulative cases of a population, one value per day from `start`.
+
+    `cases` is stored as a contiguous int64 array; as_of() and window() return
+    populations sharing that buffer instead of copying it.
+    """
+
     name: str
     population: int
     start: datetime.date
-    cases: List[int]
+    cases: Sequence[int]
+
+    def __post_init__(self) -> None:
+        self.cases = np.asarray(self.cases, dtype=np.int64)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Population):
+            return NotImplemented
+        return (
+            self.name == other.name
+            and self.population == other.population
+            and self.start == other.start
+            and np.array_equal(self.cases, other.cases)
+        )
+
+    @property
+    def end(self) -> datetime.date:
+        """Return the day after the last data point."""
+        return self.start + datetime.timedelta(days=len(self.cases))
+
+    def window(
+        self,
+        start: Optional[datetime.date] = None,
+        end: Optional[datetime.date] = None,
+    ) -> "Population":
+        """Return a view of the days in [start, end)."""
+        first = 0 if start is None else max((start - self.start).days, 0)
+        stop = len(self.cases) if end is None else max((end - self.start).days, 0)
+        return Population(
+            name=self.name,
+            population=self.population,
+            start=self.start + datetime.timedelta(days=first),
+            cases=self.cases[first:stop],
+        )
+
+    def as_of(self, version: Optional[datetime.date]) -> "Population":
+        """Return a view of the data up to and including `version`."""
+        if version is None:
+            return self
+        return self.window(end=version + datetime.timedelta(days=1))
+
+    def difference(self) -> np.ndarray:
+        """Return the new cases per day."""
+        return np.diff(self.cases, prepend=0)
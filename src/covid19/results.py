@@ -0,0 +1,218 @@
+"""
+On-disk cache of simulation results, addressed by a hash of their inputs.
+
+Each result is stored as raw little-endian columns of the daily infections,
+recoveries and probabilities; cases and immune counts are their running sums.
+Reading an entry refreshes its modification time, and the least recently used
+entries are evicted once the cache grows beyond `max_size` bytes.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import appdirs
+import numpy as np
+
+from . import cache, simulation
+from .populations import Population
+from .simulation import State
+
+
+cachedir = (
+    Path(appdirs.user_cache_dir(appname="covid19", appauthor="cjolowicz")) / "results"
+)
+max_size = 64 << 20
+enabled = True
+
+VERSION = 1
+DTYPE = np.dtype("<i8")
+FLOAT = np.dtype("<f8")
+
+
+def make_key(
+    population: Population,
+    with_immunity: bool,
+    version: Optional[datetime.date],
+    end: Optional[datetime.date],
+    average_case_duration: int,
+    probability_window_size: int,
+    eta: float,
+    horizon: Optional[datetime.date],
+    max_steps: Optional[int],
+) -> str:
+    def isoformat(date: Optional[datetime.date]) -> Optional[str]:
+        return date.isoformat() if date is not None else None
+
+    parameters = {
+        "format": VERSION,
+        "population": population.population,
+        "start": isoformat(population.start),
+        "version": isoformat(version),
+        "with_immunity": with_immunity,
+        "end": isoformat(end),
+        "average_case_duration": average_case_duration,
+        "probability_window_size": probability_window_size,
+        "eta": eta,
+        "horizon": isoformat(horizon),
+        "max_steps": max_steps,
+    }
+    hash = hashlib.blake2b(digest_size=16)
+    hash.update(json.dumps(parameters, sort_keys=True).encode())
+    hash.update(population.as_of(version).cases.astype("<i8").tobytes())
+    return hash.hexdigest()
+
+
+def cachefile(key: str) -> Path:
+    return cachedir / f"{key}.bin"
+
+
+def read(key: str, with_immunity: bool) -> Optional[List[State]]:
+    path = cachefile(key)
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return None
+
+    length, remainder = divmod(len(data), 3 * DTYPE.itemsize)
+    if remainder:
+        return None
+
+    os.utime(path)
+
+    columns = np.frombuffer(data, dtype=DTYPE).reshape(3, length)
+    infections, recoveries = columns[0], columns[1]
+    probability = columns[2].view(FLOAT)
+    cases = np.cumsum(infections - recoveries)
+    immune = np.cumsum(recoveries) if with_immunity else np.zeros_like(recoveries)
+    values = (
+        range(1, length + 1),
+        infections.tolist(),
+        recoveries.tolist(),
+        cases.tolist(),
+        immune.tolist(),
+        probability.tolist(),
+    )
+    return [State(*state) for state in zip(*values)]
+
+
+def write(key: str, states: List[State]) -> None:
+    cachedir.mkdir(parents=True, exist_ok=True)
+    with cache.atomic_write(cachefile(key), mode="wb") as fp:
+        fp.write(np.array([state.infections for state in states], DTYPE).tobytes())
+        fp.write(np.array([state.recoveries for state in states], DTYPE).tobytes())
+        fp.write(np.array([state.probability for state in states], FLOAT).tobytes())
+
+
+def evict() -> None:
+    """Remove the least recently used entries until the cache fits `max_size`."""
+    entries = []
+    for path in cachedir.glob("*.bin"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+
+
+def simulate(
+    population: Population,
+    with_immunity: bool = True,
+    version: datetime.date = None,
+    end: datetime.date = None,
+    average_case_duration: int = simulation.AVERAGE_CASE_DURATION,
+    probability_window_size: int = simulation.PROBABILITY_WINDOW_SIZE,
+    eta: float = simulation.ETA,
+    horizon: datetime.date = None,
+    max_steps: int = None,
+    timeout: float = None,
+) -> List[State]:
+    """Return list(simulation.simulate(...)), from the cache if possible.
+
+    Results bounded by `timeout` depend on timing, so they bypass the cache.
+    """
+    arguments = dict(
+        end=end,
+        average_case_duration=average_case_duration,
+        probability_window_size=probability_window_size,
+        eta=eta,
+        horizon=horizon,
+        max_steps=max_steps,
+    )
+    if not enabled or timeout is not None:
+        return list(
+            simulation.simulate(
+                population, with_immunity, version, timeout=timeout, **arguments
+            )
+        )
+
+    key = make_key(population, with_immunity, version, **arguments)
+    states = read(key, with_immunity)
+    if states is None:
+        states = list(
+            simulation.simulate(population, with_immunity, version, **arguments)
+        )
+        write(key, states)
+        evict()
+
+    return states
+
+
+def simulate_versions(
+    population: Population,
+    versions: Iterable[datetime.date],
+    with_immunity: bool = True,
+    end: datetime.date = None,
+    average_case_duration: int = simulation.AVERAGE_CASE_DURATION,
+    probability_window_size: int = simulation.PROBABILITY_WINDOW_SIZE,
+    eta: float = simulation.ETA,
+    horizon: datetime.date = None,
+    max_steps: int = None,
+) -> Iterator[Tuple[datetime.date, List[State]]]:
+    """Like simulation.simulate_versions(), from the cache if possible.
+
+    If any version is missing, all versions are simulated in a single pass.
+    """
+    arguments = dict(
+        end=end,
+        average_case_duration=average_case_duration,
+        probability_window_size=probability_window_size,
+        eta=eta,
+        horizon=horizon,
+        max_steps=max_steps,
+    )
+    versions = sorted(versions)
+    if not enabled:
+        yield from simulation.simulate_versions(
+            population, versions, with_immunity, **arguments
+        )
+        return
+
+    keys = [
+        make_key(population, with_immunity, version, **arguments)
+        for version in versions
+    ]
+    cached = [read(key, with_immunity) for key in keys]
+    if all(states is not None for states in cached):
+        yield from zip(versions, cached)
+        return
+
+    results = simulation.simulate_versions(
+        population, versions, with_immunity, **arguments
+    )
+    for key, states, (version, result) in zip(keys, cached, results):
+        if states is None:
+            write(key, result)
+        yield version, result
+
+    evict()
@@ -1,10 +1,12 @@
 from dataclasses import dataclass, replace
 import datetime
-from itertools import chain, islice
+from itertools import chain, islice, takewhile
+from math import exp, fsum, log
 from statistics import geometric_mean
-from typing import Iterator, List, Sequence
+import time
+from typing import Iterable, Iterator, List, NamedTuple, Sequence, Tuple
 
-from more_itertools import difference, pairwise
+from more_itertools import pairwise
 
 from .populations import Population
 
@@ -14,100 +16,316 @@ AVERAGE_CASE_DURATION = 14
 PROBABILITY_WINDOW_SIZE = 7
 
 
-@dataclass
+@dataclass(init=False)
 class State:
-    days: int = 0
-    infections: int = 0
-    recoveries: int = 0
-    cases: int = 0
-    immune: int = 0
-    probability: float = 0.0
+    __slots__ = ("days", "infections", "recoveries", "cases", "immune", "probability")
+
+    days: int
+    infections: int
+    recoveries: int
+    cases: int
+    immune: int
+    probability: float
+
+    def __init__(
+        self,
+        days: int = 0,
+        infections: int = 0,
+        recoveries: int = 0,
+        cases: int = 0,
+        immune: int = 0,
+        probability: float = 0.0,
+    ) -> None:
+        self.days = days
+        self.infections = infections
+        self.recoveries = recoveries
+        self.cases = cases
+        self.immune = immune
+        self.probability = probability
 
     def update(
         self, infections: int, recoveries: int, with_immunity: bool = True
-    ) -> None:
-        state = replace(self)
-        state.days += 1
-        state.infections = infections
-        state.recoveries = recoveries
-        state.cases += infections - recoveries
-        state.immune += recoveries if with_immunity else 0
-        return state
+    ) -> "State":
+        return State(
+            self.days + 1,
+            infections,
+            recoveries,
+            self.cases + infections - recoveries,
+            self.immune + recoveries if with_immunity else self.immune,
+            self.probability,
+        )
+
+
+class GeometricMean:
+    """Geometric mean of the last `size` values, in a ring buffer.
+
+    Logarithms are computed once per value and summed with math.fsum, as
+    statistics.geometric_mean() does, so the results are identical.
+    """
+
+    __slots__ = ("values", "logs", "index", "zeros", "negatives")
+
+    def __init__(self, size: int) -> None:
+        self.values: List[float] = [0] * size
+        self.logs: List[float] = [0.0] * size
+        self.index = 0
+        self.zeros = size
+        self.negatives = 0
+
+    def push(self, value: float) -> None:
+        index = self.index
+        previous = self.values[index]
+        self.zeros += (value == 0) - (previous == 0)
+        self.negatives += (value < 0) - (previous < 0)
+        self.values[index] = value
+        self.logs[index] = log(value) if value > 0 else 0.0
+        self.index = index + 1 if index + 1 < len(self.values) else 0
+
+    def full(self) -> bool:
+        """Return True if no value in the window is zero."""
+        return not self.zeros
+
+    def copy(self) -> "GeometricMean":
+        other = GeometricMean(0)
+        other.values = self.values[:]
+        other.logs = self.logs[:]
+        other.index = self.index
+        other.zeros = self.zeros
+        other.negatives = self.negatives
+        return other
+
+    def mean(self) -> float:
+        if self.negatives:
+            return geometric_mean(self.values)  # raises StatisticsError
+        return exp(fsum(self.logs) / len(self.logs))
+
+
+class Checkpoint(NamedTuple):
+    state: State
+    window: List[int]
+    index: int
+    probabilities: GeometricMean
 
 
 class Simulation:
     """Simulation to predict infections."""
 
-    def __init__(self, population: int, with_immunity: bool = True) -> None:
+    __slots__ = (
+        "population",
+        "state",
+        "window",
+        "index",
+        "probabilities",
+        "with_immunity",
+        "eta",
+    )
+
+    def __init__(
+        self,
+        population: int,
+        with_immunity: bool = True,
+        average_case_duration: int = AVERAGE_CASE_DURATION,
+        probability_window_size: int = PROBABILITY_WINDOW_SIZE,
+        eta: float = ETA,
+    ) -> None:
         self.population = population
         self.state = State()
-        self.window: List[int] = [0] * AVERAGE_CASE_DURATION
-        self.probability_window: List[int] = [0] * PROBABILITY_WINDOW_SIZE
+        self.window: List[int] = [0] * average_case_duration
+        self.index = 0
+        self.probabilities = GeometricMean(probability_window_size)
         self.with_immunity = with_immunity
+        self.eta = eta
 
     def feed(self, infections: int) -> State:
         """Add observed infections for a single day."""
         self.update_probability(infections)
-        recoveries = self.window.pop(0)
-        self.state = self.state.update(infections, recoveries, self.with_immunity)
-        self.window.append(infections)
-
-        return self.state
+        return self.advance(infections)
 
     def update_probability(self, infections: int) -> None:
         if self.state.cases > 0:
-            self.probability_window.pop(0)
-            self.probability_window.append(infections / self.state.cases)
-            if all(self.probability_window):
-                self.state.probability = geometric_mean(self.probability_window)
+            self.probabilities.push(infections / self.state.cases)
+            if self.probabilities.full():
+                self.state.probability = self.probabilities.mean()
+
+    def advance(self, infections: int) -> State:
+        index = self.index
+        recoveries = self.window[index]
+        self.window[index] = infections
+        self.index = index + 1 if index + 1 < len(self.window) else 0
+        self.state = self.state.update(infections, recoveries, self.with_immunity)
+        return self.state
+
+    def predict(self) -> float:
+        state = self.state
+        immunization: float = state.immune / self.population
+        infestation: float = state.cases / self.population
+        return state.cases * state.probability * (1 - (infestation + immunization))
 
     def step(self) -> State:
         """Predict infections for a single day."""
-        immunization: float = self.state.immune / self.population
-        infestation: float = self.state.cases / self.population
-        infections: int = int(
-            self.state.cases
-            * self.state.probability
-            * (1 - (infestation + immunization))
-        )
-        recoveries: int = self.window.pop(0)
-        self.state = self.state.update(infections, recoveries, self.with_immunity)
-        self.window.append(infections)
+        return self.advance(int(self.predict()))
 
-        return self.state
+    def steady(self) -> bool:
+        """Return True if infections stay zero while the recovery window drains.
+
+        Cases equal the sum of the window. If no entry is negative, cases can
+        only decrease, and so does the prediction, provided that the factor
+        for susceptibles is constant (with immunity) or the population is at
+        most half infected (without immunity).
+        """
+        state = self.state
+        return (
+            state.infections == 0
+            and min(self.window) >= 0
+            and (
+                self.with_immunity or 2 * state.cases + state.immune <= self.population
+            )
+            and abs(self.predict()) < 1
+        )
 
     def run(self) -> Iterator[State]:
-        """Predict infections, day by day."""
+        """Predict infections, day by day.
+
+        Once the simulation is steady, the remaining days only drain the
+        recovery window, and are produced without predicting infections.
+        """
         while True:
-            yield self.step()
+            state = self.step()
+            yield state
+            if not state.infections and self.steady():
+                break
+
+        while True:
+            yield self.advance(0)
+
+    def snapshot(self) -> Checkpoint:
+        """Capture the simulation so it can be restored later."""
+        return Checkpoint(
+            replace(self.state), self.window[:], self.index, self.probabilities.copy()
+        )
 
+    def restore(self, checkpoint: Checkpoint) -> None:
+        """Return to a captured point; the checkpoint can be restored again."""
+        self.state = replace(checkpoint.state)
+        self.window = checkpoint.window[:]
+        self.index = checkpoint.index
+        self.probabilities = checkpoint.probabilities.copy()
 
-def converge(sequence: Sequence[State]) -> Iterator[State]:
+    def fork(self) -> "Simulation":
+        """Return an independent copy of the simulation."""
+        simulation = Simulation(
+            self.population,
+            self.with_immunity,
+            len(self.window),
+            len(self.probabilities.values),
+            self.eta,
+        )
+        simulation.restore(self.snapshot())
+        return simulation
+
+
+def converge(sequence: Sequence[State], eta: float = ETA) -> Iterator[State]:
     for previous, state in pairwise(chain([None], sequence)):
         if previous is not None and (
-            previous.cases == 0 or abs(1 - state.cases / previous.cases) < ETA
+            previous.cases == 0 or abs(1 - state.cases / previous.cases) < eta
         ):
             break
         yield state
 
 
+def forecast(
+    simulation: Simulation,
+    start: datetime.date,
+    end: datetime.date = None,
+    horizon: datetime.date = None,
+    max_steps: int = None,
+    timeout: float = None,
+) -> Iterator[State]:
+    """Predict infections until they converge, or at least until `end`.
+
+    The forecast stops early after `horizon`, after `max_steps` days, or when
+    `timeout` seconds have passed.
+    """
+    states: Iterator[State] = converge(simulation.run(), simulation.eta)
+    if end is not None:
+        stop = (end - start).days + 1
+        states = chain(islice(simulation.run(), stop), states)
+
+    if horizon is not None:
+        days = (horizon - start).days + 1
+        states = takewhile(lambda state: state.days <= days, states)
+
+    if max_steps is not None:
+        states = islice(states, max_steps)
+
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
+        states = takewhile(lambda _: time.monotonic() < deadline, states)
+
+    yield from states
+
+
 def simulate(
     population: Population,
     with_immunity: bool = True,
     version: datetime.date = None,
     end: datetime.date = None,
+    average_case_duration: int = AVERAGE_CASE_DURATION,
+    probability_window_size: int = PROBABILITY_WINDOW_SIZE,
+    eta: float = ETA,
+    horizon: datetime.date = None,
+    max_steps: int = None,
+    timeout: float = None,
 ) -> Iterator[State]:
-    cases = (
-        population.cases
-        if version is None
-        else (population.cases[: (version - population.start).days + 1])
+    infections_per_day = population.as_of(version).difference().tolist()
+    simulation = Simulation(
+        population.population,
+        with_immunity,
+        average_case_duration,
+        probability_window_size,
+        eta,
     )
-    simulation = Simulation(population.population, with_immunity)
-    for infections in difference(cases):
+    for infections in infections_per_day:
         yield simulation.feed(infections)
 
-    if end is not None:
-        stop = (end - population.start).days + 1
-        yield from islice(simulation.run(), stop)
+    yield from forecast(simulation, population.start, end, horizon, max_steps, timeout)
+
+
+def simulate_versions(
+    population: Population,
+    versions: Iterable[datetime.date],
+    with_immunity: bool = True,
+    end: datetime.date = None,
+    average_case_duration: int = AVERAGE_CASE_DURATION,
+    probability_window_size: int = PROBABILITY_WINDOW_SIZE,
+    eta: float = ETA,
+    horizon: datetime.date = None,
+    max_steps: int = None,
+    timeout: float = None,
+) -> Iterator[Tuple[datetime.date, List[State]]]:
+    """Yield the states simulate() returns for each version, in date order.
+
+    The observed data is fed once, and each version forks the simulation
+    instead of replaying the data from the first day.
+    """
+    infections_per_day = population.difference().tolist()
+    simulation = Simulation(
+        population.population,
+        with_immunity,
+        average_case_duration,
+        probability_window_size,
+        eta,
+    )
+    states: List[State] = []
+    for version in sorted(versions):
+        days = (version - population.start).days + 1
+        days = min(max(days, 0), len(infections_per_day))
+        while len(states) < days:
+            states.append(simulation.feed(infections_per_day[len(states)]))
 
-    yield from converge(simulation.run())
+        # Feeding the next day updates the probability of the last state, so
+        # the forecast starts from a copy that keeps the value as of `version`.
+        fork = simulation.fork()
+        observed = states[: days - 1] + [fork.state] if days else []
+        predicted = forecast(fork, population.start, end, horizon, max_steps, timeout)
+        yield version, observed + list(predicted)